@@ -0,0 +1,128 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# =========================
+# Semantic answer cache
+# =========================
+
+class FilesVersion:
+    """
+    A version stamp for a set of files (mtime and size of each), re-checked at most every
+    `check_interval` seconds. Used to notice FAQ re-ingestion.
+    """
+
+    def __init__(self, paths: Sequence[str], check_interval: float = 5.0):
+        self.paths = list(paths)
+        self.check_interval = check_interval
+        self._stamp: Optional[Tuple] = None
+        self._next_check = 0.0
+
+    def current(self) -> Tuple:
+        now = time.monotonic()
+        if self._stamp is None or now >= self._next_check:
+            self._next_check = now + self.check_interval
+            stamp = []
+            for path in self.paths:
+                try:
+                    st = os.stat(path)
+                    stamp.append((path, st.st_mtime_ns, st.st_size))
+                except FileNotFoundError:
+                    stamp.append((path, None, None))
+            self._stamp = tuple(stamp)
+        return self._stamp
+
+
+class SemanticAnswerCache:
+    """
+    Previously generated answers keyed by the question's embedding, per scope (e.g. agent name).
+    lookup() returns a cached answer when a stored question has cosine similarity >= `threshold`
+    with the new one. Entries expire after `ttl_seconds`, the oldest are evicted beyond
+    `max_items`, and everything is dropped when the `version` of the FAQ data changes.
+    """
+
+    def __init__(self, version: FilesVersion, threshold: float = 0.93, ttl_seconds: float = 3600, max_items: int = 2000):
+        self.version = version
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict() # insertion order = age
+        self._matrices: Dict[str, Tuple[np.ndarray, List[int]]] = {} # scope -> (normalized vectors, entry ids)
+        self._next_id = 0
+        self._stamp = version.current()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    def _check_version(self) -> None:
+        stamp = self.version.current()
+        if stamp != self._stamp:
+            self._stamp = stamp
+            if self._entries:
+                self.invalidations += 1
+            self.clear()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._matrices.clear()
+
+    def _expire(self, now: float) -> None:
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_items and now - entry["created"] <= self.ttl_seconds:
+                break
+            del self._entries[entry_id]
+            self._matrices.pop(entry["scope"], None)
+
+    def _matrix(self, scope: str) -> Tuple[np.ndarray, List[int]]:
+        if scope not in self._matrices:
+            ids = [i for i, e in self._entries.items() if e["scope"] == scope]
+            vectors = np.stack([self._entries[i]["vector"] for i in ids]) if ids else np.zeros((0, 1), dtype=np.float32)
+            self._matrices[scope] = (vectors, ids)
+        return self._matrices[scope]
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        return v / (np.linalg.norm(v) or 1.0)
+
+    def lookup(self, scope: str, vector: Sequence[float]) -> Optional[Dict[str, Any]]:
+        """Best cached entry (question, answer, similarity) for this scope, or None."""
+        self._check_version()
+        self._expire(time.monotonic())
+        matrix, ids = self._matrix(scope)
+        if ids:
+            scores = matrix @ self._normalize(vector)
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                self.hits += 1
+                entry = self._entries[ids[best]]
+                return {"question": entry["question"], "answer": entry["answer"], "similarity": float(scores[best])}
+        self.misses += 1
+        return None
+
+    def store(self, scope: str, question: str, vector: Sequence[float], answer: str) -> None:
+        self._check_version()
+        now = time.monotonic()
+        self._entries[self._next_id] = {
+            "scope": scope, "question": question, "vector": self._normalize(vector), "answer": answer, "created": now,
+        }
+        self._next_id += 1
+        self._matrices.pop(scope, None)
+        self.stores += 1
+        self._expire(now)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "items": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
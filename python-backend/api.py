@@ -1,18 +1,55 @@
-from fastapi import FastAPI
+import time
+IMPORT_STARTED = time.perf_counter() # startup time is measured from here, before main.py is imported
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Tuple
 from uuid import uuid4
-import time
+from itertools import count
+import asyncio
+import functools
+import hashlib
+import os
+import json
 import logging
-import pickle
 
 from main import (
     customer_service_agent,
+    roaming_agent,
     purchase_agent,
     cancellation_agent,
-    create_initial_context
+    create_initial_context,
+    TelcoAgentContext,
+    RUN_CONFIG,
+    answer_cache,
+    call_scheduler,
+    classifier_counts,
+    close_resources,
+    embed_query,
+    faq_route_counts,
+    get_embedding_cache,
+    guardrail_listener,
+    plan_writes,
+    run_blocking,
+    warm_up,
+    guardrail_verdict_cache,
+)
+from conversation_store import (
+    CachedConversationStore,
+    ConcurrentUpdateError,
+    ConversationStore,
+    InMemoryConversationStore,
+    SqliteConversationStore,
 )
+from history import HistoryPolicy, compact_history
+from guardrail_fastpath import decision_counts
+from telemetry import histogram, register_collector, render_prometheus, span, start_turn
+from turn_guard import ConversationLocks, IdempotencyCache
+from scheduler import Overloaded, PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL, call_priority
+from backoffice import last_rows_per_second, router as backoffice_router, row_counts as backoffice_row_counts
 
 from agents import (
     Runner,
@@ -24,12 +61,46 @@ from agents import (
     InputGuardrailTripwireTriggered,
     Handoff,
 )
+from openai.types.responses import ResponseTextDeltaEvent
+
+try: # SSE frames and the agent catalog are encoded by hand; orjson does that several times faster
+    import orjson
+
+    def _dumps(data: Any) -> str:
+        return orjson.dumps(data, default=str).decode("utf-8")
+except ImportError:
+    def _dumps(data: Any) -> str:
+        return json.dumps(data, default=str)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# startup state reported by /readyz and /metrics
+startup: Dict[str, Any] = {"ready": False, "error": None, "import_seconds": None, "warm_up_seconds": None, "resources": {}}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up every resource before taking traffic; /readyz reports 200 only once this succeeded."""
+    if startup["import_seconds"] is None: # first startup of this process
+        startup["import_seconds"] = time.perf_counter() - IMPORT_STARTED
+    start = time.perf_counter()
+    try:
+        startup["resources"] = await run_blocking(warm_up)
+        get_conversation_store()
+        startup["ready"], startup["error"] = True, None
+    except Exception as e:
+        logger.exception("warm-up failed; /readyz will report not ready")
+        startup["error"] = f"{type(e).__name__}: {e}"
+    startup["warm_up_seconds"] = time.perf_counter() - start
+    logger.info(f"startup: import {startup['import_seconds']:.2f}s, warm-up {startup['warm_up_seconds']:.2f}s, ready={startup['ready']}")
+    yield
+    startup["ready"] = False
+    await plan_writes.close() # commit queued plan records before the db is closed
+    await run_blocking(close_resources)
+
+app = FastAPI(lifespan=lifespan)
+app.include_router(backoffice_router)
 
 # CORS configuration (adjust as needed for deployment)
 app.add_middleware(
@@ -40,6 +111,34 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+request_seconds = histogram("telco_http_request_seconds", "End-to-end HTTP request latency.")
+
+@app.middleware("http")
+async def _time_requests(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # note: for /chat/stream this measures time to first byte; the turn itself is covered by spans
+    request_seconds.observe(time.perf_counter() - start, path=request.url.path, status=response.status_code)
+    return response
+
+CONFLICT_DETAIL = "This conversation was updated by another request; reload it and retry."
+
+@app.exception_handler(ConcurrentUpdateError)
+async def _concurrent_update(request: Request, exc: ConcurrentUpdateError):
+    """Lost compare-and-swap on the conversation state (another worker saved it first)."""
+    return JSONResponse(status_code=409, content={"detail": CONFLICT_DETAIL, "conversation_id": str(exc)})
+
+OVERLOADED_DETAIL = "The assistant is busy right now; please try again shortly."
+
+@app.exception_handler(Overloaded)
+async def _overloaded(request: Request, exc: Overloaded):
+    """Shed by the outbound call scheduler: 429 (token budget) or 503 (queue full), with Retry-After."""
+    return JSONResponse(
+        status_code=exc.status,
+        content={"detail": OVERLOADED_DETAIL, "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # =========================
 # Models
 # =========================
@@ -47,6 +146,7 @@ app.add_middleware(
 class ChatRequest(BaseModel):
     conversation_id: Optional[str] = None
     message: str
+    cursor: Optional[int] = None # `cursor` of the last response the client applied; enables delta responses
 
 class MessageResponse(BaseModel):
     content: str
@@ -67,47 +167,79 @@ class GuardrailCheck(BaseModel):
     reasoning: str
     passed: bool
     timestamp: float
+    decided_by: Optional[str] = None # which stage decided: "rule", "cache" (verdict cache), "answer_cache", "classifier" or "llm"
 
 class ChatResponse(BaseModel):
     conversation_id: str
     current_agent: str
     messages: List[MessageResponse]
     events: List[AgentEvent]
-    context: Dict[str, Any]
-    agents: List[Dict[str, Any]]
+    context: Dict[str, Any] # only the changed keys when `delta` is true
+    agents: Optional[List[Dict[str, Any]]] = None # omitted from delta responses (see GET /agents)
     guardrails: List[GuardrailCheck] = []
+    timings: Optional[List[Dict[str, Any]]] = None # per-phase spans, when requested with ?timings=true
+    cursor: Optional[int] = None # conversation version after this turn; send it back with the next request
+    delta: bool = False
 
 # =========================
-# In-memory store for conversation state
+# Store for conversation state
 # =========================
 
-class ConversationStore:
-    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
-        pass
+def _make_conversation_store() -> ConversationStore:
+    """
+    Pick the conversation store from the environment (CONVERSATION_STORE=memory|sqlite).
+    Use sqlite (one CONVERSATION_DB shared by all workers) when running more than one process;
+    CONVERSATION_CACHE=<n> adds a process-local read-through cache of n conversations.
+    """
+    ttl = float(os.environ.get("CONVERSATION_TTL", 3600)) or None # 0 disables idle expiry
+    if os.environ.get("CONVERSATION_STORE", "memory") == "sqlite":
+        store = SqliteConversationStore(
+            os.environ.get("CONVERSATION_DB", "conversations.db"),
+            context_factory=TelcoAgentContext.model_validate,
+            ttl_seconds=ttl,
+        )
+        cache_size = int(os.environ.get("CONVERSATION_CACHE", 0))
+        return CachedConversationStore(store, max_items=cache_size) if cache_size > 0 else store
+    return InMemoryConversationStore(
+        max_conversations=int(os.environ.get("CONVERSATION_MAX", 1000)),
+        ttl_seconds=ttl,
+    )
 
-    def save(self, conversation_id: str, state: Dict[str, Any]):
-        pass
+conversation_store: Optional[ConversationStore] = None
 
-class InMemoryConversationStore(ConversationStore):
-    _conversations: Dict[str, Dict[str, Any]] = {}
+def get_conversation_store() -> ConversationStore:
+    global conversation_store
+    if conversation_store is None:
+        conversation_store = _make_conversation_store()
+    return conversation_store
 
-    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
-        return self._conversations.get(conversation_id)
+# turns of one conversation run one at a time; retried messages (same Idempotency-Key header)
+# get the first run's response instead of starting another run (see turn_guard.py)
+conversation_locks = ConversationLocks()
+idempotency_cache = IdempotencyCache(
+    max_items=int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", 10000)),
+    ttl_seconds=float(os.environ.get("IDEMPOTENCY_TTL", 600)),
+)
 
-    def save(self, conversation_id: str, state: Dict[str, Any]):
-        self._conversations[conversation_id] = state
-        
-# TODO: when deploying this app in scale, switch to your own production-ready implementation
-conversation_store = InMemoryConversationStore()
+# how much conversation history is re-sent to the model each turn (see history.py)
+history_policy = HistoryPolicy.from_env()
 
 # =========================
 # Helpers
 # =========================
 
+# event/guardrail ids: a per-process random prefix plus a counter, unique without a uuid per event
+_ID_PREFIX = os.urandom(4).hex()
+_ids = count()
+
+def _new_id() -> str:
+    return f"{_ID_PREFIX}{next(_ids):x}"
+
 def _get_agent_by_name(name: str):
     """Return the agent object by name."""
     agents = {
         customer_service_agent.name: customer_service_agent,
+        roaming_agent.name: roaming_agent,
         purchase_agent.name: purchase_agent,
         cancellation_agent.name: cancellation_agent,
     }
@@ -138,219 +270,769 @@ def _build_agents_list() -> List[Dict[str, Any]]:
         }
     return [
         make_agent_dict(customer_service_agent),
+        make_agent_dict(roaming_agent),
         make_agent_dict(purchase_agent),
         make_agent_dict(cancellation_agent),
     ]
 
-# =========================
-# Main Chat Endpoint
-# =========================
+@functools.lru_cache(maxsize=1)
+def _agents_catalog() -> Tuple[List[Dict[str, Any]], bytes, str]:
+    """The agent graph is static: build it, its json body and its ETag once per process."""
+    agents = _build_agents_list()
+    body = _dumps(agents).encode("utf-8")
+    return agents, body, '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(req: ChatRequest):
+def _sync_fields(
+    state: Dict[str, Any], cursor: Optional[int], loaded_version: int, old_context: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
     """
-    Main chat endpoint for agent orchestration.
-    Handles conversation state, agent routing, and guardrail checks.
+    The context/agents/cursor fields of a ChatResponse. A client whose cursor matches the version
+    this turn started from gets a delta: only the changed context keys and no agent catalog.
+    Anyone else (no cursor, a stale one, a new conversation) gets the full context and catalog.
     """
-    # Initialize or retrieve conversation state
-    is_new = not req.conversation_id or conversation_store.get(req.conversation_id) is None
+    context = state["context"].model_dump()
+    if cursor is not None and cursor == loaded_version and old_context is not None:
+        changed = {k: v for k, v in context.items() if old_context.get(k) != v}
+        return {"context": changed, "agents": None, "cursor": state.get("version"), "delta": True}
+    return {"context": context, "agents": _agents_catalog()[0], "cursor": state.get("version"), "delta": False}
+
+# =========================
+# Turn helpers
+# =========================
+
+async def _store_call(fn, *args):
+    """Call a conversation store method, on IO_EXECUTOR unless the store is in-process."""
+    if get_conversation_store().blocking:
+        return await run_blocking(fn, *args)
+    return fn(*args)
+
+async def _load_conversation(req: ChatRequest) -> Tuple[str, Dict[str, Any], bool]:
+    """Return (conversation_id, state, is_new), creating a fresh state if needed."""
+    state = None
+    if req.conversation_id:
+        with span("store", op="get"):
+            state = await _store_call(get_conversation_store().get, req.conversation_id) # get existing convo history
+    is_new = state is None
     if is_new:
         conversation_id: str = uuid4().hex
-        ctx = create_initial_context()
-        current_agent_name = customer_service_agent.name
         state: Dict[str, Any] = {
             "input_items": [],
-            "context": ctx,
-            "current_agent": current_agent_name,
+            "context": create_initial_context(),
+            "current_agent": customer_service_agent.name,
         }
         logger.info(f"new conversation: {conversation_id}")
-        if req.message.strip() == "": #if empty message, save current state (i.e. no change)
-            conversation_store.save(conversation_id, state)
-            return ChatResponse(
-                conversation_id=conversation_id,
-                current_agent=current_agent_name,
-                messages=[],
-                events=[],
-                context=ctx.model_dump(),
-                agents=_build_agents_list(),
-                guardrails=[],
-            )
     else:
         conversation_id = req.conversation_id  # type: ignore
-        state = conversation_store.get(conversation_id) # get existing convo history
         logger.info(f"existing conversation: {conversation_id}")
+    return conversation_id, state, is_new
+
+async def _save_conversation(conversation_id: str, state: Dict[str, Any]) -> None:
+    with span("store", op="save"):
+        await _store_call(get_conversation_store().save, conversation_id, state)
+
+def _set_turn_priority(state: Dict[str, Any]) -> None:
+    """Schedule this turn's model calls: purchase/cancellation flows first, brand new conversations last."""
+    if state["current_agent"] in (purchase_agent.name, cancellation_agent.name):
+        call_priority.set(PRIORITY_HIGH)
+    elif not state["input_items"]:
+        call_priority.set(PRIORITY_LOW)
+    else:
+        call_priority.set(PRIORITY_NORMAL)
+
+def _admit(req: ChatRequest) -> None:
+    """Turn the request away up front (429/503) if the call scheduler would shed its calls anyway."""
+    call_scheduler.admit(PRIORITY_NORMAL if req.conversation_id else PRIORITY_LOW)
+
+async def _prepare_input(state: Dict[str, Any], message: str) -> None:
+    """Append the user message and compact the history per history_policy, logging prompt size."""
+    state["input_items"].append({"content": message, "role": "user"}) # append new user message
+    state["input_items"], report = await compact_history(state["input_items"], history_policy, RUN_CONFIG)
+    logger.info(f"prompt tokens (est.): {report['tokens_before']} before compaction, {report['tokens_after']} after")
+
+def _tripwire_guardrail_checks(
+    e: InputGuardrailTripwireTriggered, agent, message: str
+) -> List[GuardrailCheck]:
+    """Mark the guardrail that tripped as failed and the others on the agent as passed."""
+    failed = e.guardrail_result.guardrail
+    gr_output = e.guardrail_result.output.output_info
+    gr_reasoning = getattr(gr_output, "reasoning", "")
+    gr_timestamp = time.time() * 1000
+    return [
+        GuardrailCheck(
+            id=_new_id(),
+            name=_get_guardrail_name(g),
+            input=message,
+            reasoning=(gr_reasoning if g == failed else ""),
+            passed=(g != failed),
+            timestamp=gr_timestamp,
+            decided_by=(getattr(gr_output, "decided_by", None) if g == failed else None),
+        )
+        for g in agent.input_guardrails
+    ]
+
+def _passed_guardrail_checks(agent, message: str, results=()) -> List[GuardrailCheck]:
+    """
+    Build guardrail results for a turn where no guardrail tripped.
+    `results` are the run's input guardrail results, used to report how each verdict was reached.
+    """
+    verdicts = {_get_guardrail_name(r.guardrail): r.output.output_info for r in results}
+    checks = []
+    for g in getattr(agent, "input_guardrails", []):
+        name = _get_guardrail_name(g)
+        verdict = verdicts.get(name)
+        checks.append(GuardrailCheck(
+            id=_new_id(),
+            name=name,
+            input=message,
+            reasoning=getattr(verdict, "reasoning", ""),
+            passed=True,
+            timestamp=time.time() * 1000,
+            decided_by=getattr(verdict, "decided_by", None),
+        ))
+    return checks
+
+def _verdict_check(name: str, message: str, verdict) -> GuardrailCheck:
+    """A guardrail check from one decided verdict (see main.guardrail_listener)."""
+    return GuardrailCheck(
+        id=_new_id(),
+        name=name,
+        input=message,
+        reasoning=verdict.reasoning,
+        passed=verdict.passed,
+        timestamp=time.time() * 1000,
+        decided_by=verdict.decided_by,
+    )
+
+def _item_events(item) -> List[AgentEvent]:
+    """
+    Convert a single run item into UI events.
+    4 possibilities: message output, handoff output, tool call, tool call output.
+    """
+    events: List[AgentEvent] = []
+    if isinstance(item, MessageOutputItem):
+        text = ItemHelpers.text_message_output(item)
+        events.append(AgentEvent(id=_new_id(), type="message", agent=item.agent.name, content=text))
+        logger.info(f"returned message: {text}")
+    # Handle handoff output and agent switching
+    elif isinstance(item, HandoffOutputItem):
+        # Record the handoff event
+        events.append(
+            AgentEvent(
+                id=_new_id(),
+                type="handoff",
+                agent=item.source_agent.name,
+                content=f"{item.source_agent.name} -> {item.target_agent.name}",
+                metadata={"source_agent": item.source_agent.name, "target_agent": item.target_agent.name},
+            )
+        )
+        # If there is an on_handoff callback defined for this handoff, show it as a tool call
+        from_agent = item.source_agent
+        to_agent = item.target_agent
+        logger.info(f"handoff: {from_agent} -> {to_agent}")
+        # Find the Handoff object on the source agent matching the target
+        ho = next(
+            (h for h in getattr(from_agent, "handoffs", [])
+             if isinstance(h, Handoff) and getattr(h, "agent_name", None) == to_agent.name),
+            None,
+        )
+        if ho:
+            fn = ho.on_invoke_handoff
+            fv = fn.__code__.co_freevars
+            cl = fn.__closure__ or []
+            if "on_handoff" in fv:
+                idx = fv.index("on_handoff")
+                if idx < len(cl) and cl[idx].cell_contents:
+                    cb = cl[idx].cell_contents
+                    cb_name = getattr(cb, "__name__", repr(cb))
+                    events.append(
+                        AgentEvent(
+                            id=_new_id(),
+                            type="tool_call",
+                            agent=to_agent.name,
+                            content=cb_name,
+                        )
+                    )
+    elif isinstance(item, ToolCallItem):
+        tool_name = getattr(item.raw_item, "name", None)
+        raw_args = getattr(item.raw_item, "arguments", None)
+        tool_args: Any = raw_args
+        logger.info(f"tool call: {tool_name}")
+        if isinstance(raw_args, str):
+            try:
+                tool_args = json.loads(raw_args)
+            except Exception:
+                pass
+        events.append(
+            AgentEvent(
+                id=_new_id(),
+                type="tool_call",
+                agent=item.agent.name,
+                content=tool_name or "",
+                metadata={"tool_args": tool_args},
+            )
+        )
+    elif isinstance(item, ToolCallOutputItem):
+        events.append(
+            AgentEvent(
+                id=_new_id(),
+                type="tool_output",
+                agent=item.agent.name,
+                content=str(item.output),
+                metadata={"tool_result": item.output},
+            )
+        )
+    return events
+
+def _context_update_event(old_context: Dict[str, Any], context, agent_name: str) -> Optional[AgentEvent]:
+    """Return a context_update event if any context field changed (from tool use etc.)."""
+    new_context = context.model_dump()
+    changes = {k: new_context[k] for k in new_context if old_context.get(k) != new_context[k]}
+    if not changes:
+        return None
+    logger.info(f"context updated")
+    return AgentEvent(
+        id=_new_id(),
+        type="context_update",
+        agent=agent_name,
+        content="",
+        metadata={"changes": changes},
+    )
+
+# =========================
+# Semantic answer cache
+# =========================
+
+async def _lookup_answer(state: Dict[str, Any], message: str) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+    """
+    Answer-cache lookup for a Roaming Agent turn: (hit or None, query embedding).
+    Returns (None, None) when the cache is off or does not apply to this turn.
+    """
+    if answer_cache is None or state["current_agent"] != roaming_agent.name or not message.strip():
+        return None, None
+    with span("answer_cache"):
+        vector = await embed_query(message)
+        return answer_cache.lookup(state["current_agent"], vector), vector
+
+def _answer_from_cache(
+    state: Dict[str, Any], agent, message: str, hit: Dict[str, Any]
+) -> Tuple[MessageResponse, AgentEvent, List[GuardrailCheck]]:
+    """Record a cached answer as this turn's reply; returns the message, its event and the guardrail report."""
+    logger.info(f"answer cache hit ({hit['similarity']:.3f}) for: {hit['question']}")
+    state["input_items"].append({"role": "assistant", "content": hit["answer"]})
+    event = AgentEvent(
+        id=_new_id(), type="message", agent=agent.name, content=hit["answer"],
+        metadata={"cached": True, "similarity": round(hit["similarity"], 4), "cached_question": hit["question"]},
+    )
+    checks = _passed_guardrail_checks(agent, message)
+    for check in checks: # a near-identical question already passed the guardrails
+        check.reasoning = "Same question as one answered earlier."
+        check.decided_by = "answer_cache"
+        decision_counts[(check.name, "answer_cache")] += 1
+    return MessageResponse(content=hit["answer"], agent=agent.name), event, checks
+
+def _store_answer(state: Dict[str, Any], message: str, query_vector, new_items, old_context: Dict[str, Any]) -> None:
+    """Cache the reply of a completed turn (looked up with `query_vector`) if it is a plain FAQ answer."""
+    if query_vector is None:
+        return
+    answer = _cacheable_answer(new_items, state["current_agent"], old_context, state["context"])
+    if answer is not None:
+        answer_cache.store(state["current_agent"], message, query_vector, answer)
+
+def _cacheable_answer(new_items, agent_name: str, old_context: Dict[str, Any], context: TelcoAgentContext) -> Optional[str]:
+    """
+    The turn's reply if the turn was a plain FAQ answer: only roaming_faq_lookup_tool calls with a
+    confident match, then a single message, no handoff, no context change and nothing customer-specific.
+    """
+    if context.model_dump() != old_context:
+        return None
+    answer: Optional[str] = None
+    used_faq = False
+    for item in new_items:
+        if getattr(getattr(item, "agent", None), "name", None) != agent_name:
+            return None
+        if isinstance(item, ToolCallItem):
+            if getattr(item.raw_item, "name", None) != "roaming_faq_lookup_tool":
+                return None
+            used_faq = True
+        elif isinstance(item, ToolCallOutputItem):
+            if str(item.output).startswith("No confident FAQ match"):
+                return None
+        elif isinstance(item, MessageOutputItem) and answer is None:
+            answer = ItemHelpers.text_message_output(item)
+        else: # handoffs, a second message, anything unexpected
+            return None
+    if not used_faq or not answer:
+        return None
+    personal = [part for value in (context.customer_name, context.phone_number) if value for part in str(value).split() if len(part) > 2]
+    if any(part.lower() in answer.lower() for part in personal):
+        return None
+    return answer
+
+# =========================
+# Main Chat Endpoint
+# =========================
+
+def _idempotency_key(endpoint: str, req: ChatRequest, key: Optional[str]) -> Optional[str]:
+    return f"{endpoint}:{req.conversation_id or ''}:{key}" if key else None
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat_endpoint(req: ChatRequest, timings: bool = False, idempotency_key: Optional[str] = Header(None)):
+    """
+    Main chat endpoint for agent orchestration.
+    Handles conversation state, agent routing, and guardrail checks.
+    With ?timings=true the response includes the turn's span breakdown.
+    Requests carrying an Idempotency-Key header that was already used return the original response.
+    """
+    key = _idempotency_key("chat", req, idempotency_key)
+    while key:
+        pending, owner = idempotency_cache.begin(key)
+        if owner:
+            break
+        response = await idempotency_cache.wait(pending)
+        if response is not None:
+            return response
+    try:
+        _admit(req) # only requests that will actually run; replays of a finished turn are free
+        async with conversation_locks.hold(req.conversation_id):
+            response = await _chat_turn(req, timings)
+    except BaseException:
+        if key:
+            idempotency_cache.fail(key)
+        raise
+    if key:
+        idempotency_cache.complete(key, response)
+    return response
+
+async def _chat_turn(req: ChatRequest, timings: bool) -> ChatResponse:
+    """One /chat turn: load the conversation, run the current agent, save and build the response."""
+    spans = start_turn()
+    # Initialize or retrieve conversation state
+    conversation_id, state, is_new = await _load_conversation(req)
+    if is_new and req.message.strip() == "": #if empty message, save current state (i.e. no change)
+        await _save_conversation(conversation_id, state)
+        return ChatResponse(
+            conversation_id=conversation_id,
+            current_agent=state["current_agent"],
+            messages=[],
+            events=[],
+            **_sync_fields(state, None, 0, None),
+            guardrails=[],
+            timings=spans if timings else None,
+        )
 
     current_agent = _get_agent_by_name(state["current_agent"])
-    state["input_items"].append({"content": req.message, "role": "user"}) # append new user message
+    loaded_version = state.get("version", 0)
     old_context = state["context"].model_dump().copy() #save existing context (to keep track of changes later)
-    guardrail_checks: List[GuardrailCheck] = []
+    _set_turn_priority(state)
+    hit, query_vector = await _lookup_answer(state, req.message)
+    await _prepare_input(state, req.message)
+    if hit is not None:
+        message, event, guardrail_checks = _answer_from_cache(state, current_agent, req.message, hit)
+        await _save_conversation(conversation_id, state)
+        return ChatResponse(
+            conversation_id=conversation_id,
+            current_agent=current_agent.name,
+            messages=[message],
+            events=[event],
+            **_sync_fields(state, req.cursor, loaded_version, old_context),
+            guardrails=guardrail_checks,
+            timings=spans if timings else None,
+        )
 
     # now start processing user query
     try:
-        result = await Runner.run(current_agent, state["input_items"], context=state["context"])
+        result = await Runner.run(current_agent, state["input_items"], context=state["context"], run_config=RUN_CONFIG)
     except InputGuardrailTripwireTriggered as e:
-        failed = e.guardrail_result.guardrail
-        gr_output = e.guardrail_result.output.output_info
-        gr_reasoning = getattr(gr_output, "reasoning", "")
-        gr_input = req.message
-        gr_timestamp = time.time() * 1000
         logger.warning("guardrail tripped")
-        for g in current_agent.input_guardrails:
-            guardrail_checks.append(GuardrailCheck(
-                id=uuid4().hex,
-                name=_get_guardrail_name(g),
-                input=gr_input,
-                reasoning=(gr_reasoning if g == failed else ""),
-                passed=(g != failed),
-                timestamp=gr_timestamp,
-            ))
+        guardrail_checks = _tripwire_guardrail_checks(e, current_agent, req.message)
         refusal = "Sorry, I can only answer questions related to Singtel roaming plans."
         state["input_items"].append({"role": "assistant", "content": refusal})
+        await _save_conversation(conversation_id, state)
         return ChatResponse(
             conversation_id=conversation_id,
             current_agent=current_agent.name,
             messages=[MessageResponse(content=refusal, agent=current_agent.name)],
             events=[],
-            context=state["context"].model_dump(),
-            agents=_build_agents_list(),
+            **_sync_fields(state, req.cursor, loaded_version, old_context),
             guardrails=guardrail_checks,
+            timings=spans if timings else None,
         )
 
     messages: List[MessageResponse] = []
     events: List[AgentEvent] = []
 
     for item in result.new_items:
-        ## 4 possibilities
-        ## 1. Message output
-        ## 2. Handoff output
-        ## 3. Tool call
-        ## 4. Tool call output
+        item_events = _item_events(item)
+        events.extend(item_events)
         if isinstance(item, MessageOutputItem):
-            text = ItemHelpers.text_message_output(item)
-            messages.append(MessageResponse(content=text, agent=item.agent.name))
-            events.append(AgentEvent(id=uuid4().hex, type="message", agent=item.agent.name, content=text))
-            logger.info(f"returned message: {text}")
-        # Handle handoff output and agent switching
+            messages.append(MessageResponse(content=item_events[0].content, agent=item.agent.name))
         elif isinstance(item, HandoffOutputItem):
-            # Record the handoff event
-            events.append(
-                AgentEvent(
-                    id=uuid4().hex,
-                    type="handoff",
-                    agent=item.source_agent.name,
-                    content=f"{item.source_agent.name} -> {item.target_agent.name}",
-                    metadata={"source_agent": item.source_agent.name, "target_agent": item.target_agent.name},
-                )
-            )
-            # If there is an on_handoff callback defined for this handoff, show it as a tool call
-            from_agent = item.source_agent
-            to_agent = item.target_agent
-            logger.info(f"handoff: {from_agent} -> {to_agent}")
-            # Find the Handoff object on the source agent matching the target
-            ho = next(
-                (h for h in getattr(from_agent, "handoffs", [])
-                 if isinstance(h, Handoff) and getattr(h, "agent_name", None) == to_agent.name),
-                None,
-            )
-            if ho:
-                fn = ho.on_invoke_handoff
-                fv = fn.__code__.co_freevars
-                cl = fn.__closure__ or []
-                if "on_handoff" in fv:
-                    idx = fv.index("on_handoff")
-                    if idx < len(cl) and cl[idx].cell_contents:
-                        cb = cl[idx].cell_contents
-                        cb_name = getattr(cb, "__name__", repr(cb))
-                        events.append(
-                            AgentEvent(
-                                id=uuid4().hex,
-                                type="tool_call",
-                                agent=to_agent.name,
-                                content=cb_name,
-                            )
-                        )
             current_agent = item.target_agent
-        elif isinstance(item, ToolCallItem):
-            tool_name = getattr(item.raw_item, "name", None)
-            raw_args = getattr(item.raw_item, "arguments", None)
-            tool_args: Any = raw_args
-            logger.info(f"tool call: {tool_name}")
-            if isinstance(raw_args, str):
-                try:
-                    import json
-                    tool_args = json.loads(raw_args)
-                except Exception:
-                    pass
-            events.append(
-                AgentEvent(
-                    id=uuid4().hex,
-                    type="tool_call",
-                    agent=item.agent.name,
-                    content=tool_name or "",
-                    metadata={"tool_args": tool_args},
-                )
-            )
-            # # If the tool is display_seat_map, send a special message so the UI can render the seat selector.
-            # if tool_name == "display_seat_map":
-            #     messages.append(
-            #         MessageResponse(
-            #             content="DISPLAY_SEAT_MAP",
-            #             agent=item.agent.name,
-            #         )
-            #     )
-        elif isinstance(item, ToolCallOutputItem):
-            events.append(
-                AgentEvent(
-                    id=uuid4().hex,
-                    type="tool_output",
-                    agent=item.agent.name,
-                    content=str(item.output),
-                    metadata={"tool_result": item.output},
-                )
-            )
 
-    # check for any changes in the context (from tool use etc.)
-    new_context = state["context"].dict()
-    changes = {k: new_context[k] for k in new_context if old_context.get(k) != new_context[k]}
-    if changes:
-        events.append(
-            AgentEvent(
-                id=uuid4().hex,
-                type="context_update",
-                agent=current_agent.name,
-                content="",
-                metadata={"changes": changes},
-            )
-        )
-        logger.info(f"context updated")
+    context_event = _context_update_event(old_context, state["context"], current_agent.name)
+    if context_event:
+        events.append(context_event)
 
     state["input_items"] = result.to_input_list()
+    _store_answer(state, req.message, query_vector, result.new_items, old_context)
     state["current_agent"] = current_agent.name
-    conversation_store.save(conversation_id, state)
-
-    # Build guardrail results: mark failures (if any), and any others as passed
-    final_guardrails: List[GuardrailCheck] = []
-    for g in getattr(current_agent, "input_guardrails", []):
-        name = _get_guardrail_name(g)
-        failed = next((gc for gc in guardrail_checks if gc.name == name), None)
-        if failed:
-            final_guardrails.append(failed)
-        else:
-            final_guardrails.append(GuardrailCheck(
-                id=uuid4().hex,
-                name=name,
-                input=req.message,
-                reasoning="",
-                passed=True,
-                timestamp=time.time() * 1000,
-            ))
+    await _save_conversation(conversation_id, state)
 
     return ChatResponse(
         conversation_id=conversation_id,
         current_agent=current_agent.name,
         messages=messages,
         events=events,
-        context=state["context"].dict(),
-        agents=_build_agents_list(),
-        guardrails=final_guardrails,
+        **_sync_fields(state, req.cursor, loaded_version, old_context),
+        guardrails=_passed_guardrail_checks(current_agent, req.message, result.input_guardrail_results),
+        timings=spans if timings else None,
+    )
+
+# =========================
+# Streaming Chat Endpoint
+# =========================
+
+def _sse(event: str, data: Any) -> str:
+    """Encode a single Server-Sent Events frame."""
+    if isinstance(data, BaseModel):
+        data = data.model_dump()
+    return f"event: {event}\ndata: {_dumps(data)}\n\n"
+
+async def _with_verdicts(events: AsyncIterator[Any], verdicts: asyncio.Queue) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    Interleave the runner's stream events with guardrail verdicts as each one is decided:
+    yields ("event", stream event) and ("guardrail", (name, verdict)). Errors from the run propagate.
+    """
+    next_event = asyncio.ensure_future(events.__anext__())
+    next_verdict = asyncio.ensure_future(verdicts.get())
+    try:
+        while True:
+            await asyncio.wait((next_event, next_verdict), return_when=asyncio.FIRST_COMPLETED)
+            if next_verdict.done():
+                yield "guardrail", next_verdict.result()
+                next_verdict = asyncio.ensure_future(verdicts.get())
+            if next_event.done():
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    return
+                yield "event", event
+                next_event = asyncio.ensure_future(events.__anext__())
+    finally:
+        next_verdict.cancel()
+        next_event.cancel()
+
+async def _stream_turn(
+    conversation_id: str, state: Dict[str, Any], message: str, timings: bool = False, cursor: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    Run one turn with the streamed runner and yield SSE frames as they happen:
+    message_delta, message, handoff, tool_call, tool_output, context_update, guardrail, done.
+    """
+    spans = start_turn()
+    yield _sse("conversation", {"conversation_id": conversation_id})
+
+    current_agent = _get_agent_by_name(state["current_agent"])
+    loaded_version = state.get("version", 0)
+    old_context = state["context"].model_dump().copy()
+    _set_turn_priority(state)
+    hit, query_vector = await _lookup_answer(state, message)
+    await _prepare_input(state, message)
+    if hit is not None:
+        reply, event, guardrail_checks = _answer_from_cache(state, current_agent, message, hit)
+        try:
+            await _save_conversation(conversation_id, state)
+        except ConcurrentUpdateError:
+            yield _sse("error", {"detail": CONFLICT_DETAIL, "status": 409})
+            return
+        yield _sse(event.type, event)
+        for check in guardrail_checks:
+            yield _sse("guardrail", check)
+        yield _sse("done", ChatResponse(
+            conversation_id=conversation_id,
+            current_agent=current_agent.name,
+            messages=[reply],
+            events=[],
+            **_sync_fields(state, cursor, loaded_version, old_context),
+            guardrails=guardrail_checks,
+            timings=spans if timings else None,
+        ))
+        return
+    messages: List[MessageResponse] = []
+    streamed: Dict[str, GuardrailCheck] = {} # guardrail frames already sent, by guardrail name
+
+    verdicts: asyncio.Queue = asyncio.Queue()
+    guardrail_listener.set(lambda name, verdict: verdicts.put_nowait((name, verdict)))
+    result = Runner.run_streamed(current_agent, state["input_items"], context=state["context"], run_config=RUN_CONFIG)
+    try:
+        async for kind, event in _with_verdicts(result.stream_events(), verdicts):
+            if kind == "guardrail": # sent as soon as the guardrail decides, while the model is already answering
+                name, verdict = event
+                check = _verdict_check(name, message, verdict)
+                streamed[check.name] = check
+                yield _sse("guardrail", check)
+            elif event.type == "raw_response_event":
+                if isinstance(event.data, ResponseTextDeltaEvent) and event.data.delta:
+                    yield _sse("message_delta", {"agent": current_agent.name, "delta": event.data.delta})
+            elif event.type == "agent_updated_stream_event":
+                current_agent = event.new_agent
+            elif event.type == "run_item_stream_event":
+                for agent_event in _item_events(event.item):
+                    if isinstance(event.item, MessageOutputItem):
+                        messages.append(MessageResponse(content=agent_event.content, agent=event.item.agent.name))
+                    yield _sse(agent_event.type, agent_event)
+    except InputGuardrailTripwireTriggered as e:
+        # guardrails run alongside the first model call, so partial deltas may already
+        # have been sent; clients should discard the in-progress message on this frame
+        logger.warning("guardrail tripped")
+        current_agent = _get_agent_by_name(state["current_agent"])
+        refusal = "Sorry, I can only answer questions related to Singtel roaming plans."
+        state["input_items"].append({"role": "assistant", "content": refusal})
+        try:
+            await _save_conversation(conversation_id, state)
+        except ConcurrentUpdateError:
+            yield _sse("error", {"detail": CONFLICT_DETAIL, "status": 409})
+            return
+        guardrail_checks = [streamed.get(c.name, c) for c in _tripwire_guardrail_checks(e, current_agent, message)]
+        for check in guardrail_checks:
+            if check.name not in streamed:
+                yield _sse("guardrail", check)
+        yield _sse("done", ChatResponse(
+            conversation_id=conversation_id,
+            current_agent=current_agent.name,
+            messages=[MessageResponse(content=refusal, agent=current_agent.name)],
+            events=[],
+            **_sync_fields(state, cursor, loaded_version, old_context),
+            guardrails=guardrail_checks,
+            timings=spans if timings else None,
+        ))
+        return
+    except Overloaded as e:
+        logger.warning(f"turn shed by the call scheduler: {e.reason}")
+        yield _sse("error", {"detail": OVERLOADED_DETAIL, "status": e.status, "retry_after": e.retry_after})
+        return
+    except Exception:
+        logger.exception("streamed run failed")
+        yield _sse("error", {"detail": "Agent run failed."})
+        return
+
+    context_event = _context_update_event(old_context, state["context"], current_agent.name)
+    if context_event:
+        yield _sse(context_event.type, context_event)
+
+    guardrail_checks = [
+        streamed.get(c.name, c) for c in _passed_guardrail_checks(current_agent, message, result.input_guardrail_results)
+    ]
+    for check in guardrail_checks:
+        if check.name not in streamed:
+            yield _sse("guardrail", check)
+
+    state["input_items"] = result.to_input_list()
+    _store_answer(state, message, query_vector, result.new_items, old_context)
+    state["current_agent"] = current_agent.name
+    try:
+        await _save_conversation(conversation_id, state)
+    except ConcurrentUpdateError: # headers are already sent, so the 409 travels as an error frame
+        yield _sse("error", {"detail": CONFLICT_DETAIL, "status": 409})
+        return
+
+    yield _sse("done", ChatResponse(
+        conversation_id=conversation_id,
+        current_agent=current_agent.name,
+        messages=messages,
+        events=[],
+        **_sync_fields(state, cursor, loaded_version, old_context),
+        guardrails=guardrail_checks,
+        timings=spans if timings else None,
+    ))
+
+async def _serialized_stream(req: ChatRequest, timings: bool, key: Optional[str], admitted: bool) -> AsyncIterator[str]:
+    """
+    Run the streamed turn while holding the conversation lock. A retry of a keyed request
+    does not run again: it waits for the original turn and receives only its `done` frame.
+    """
+    while key:
+        pending, owner = idempotency_cache.begin(key)
+        if owner:
+            break
+        done_frame = await idempotency_cache.wait(pending)
+        if done_frame is not None:
+            yield done_frame
+            return
+    done_frame = None
+    try:
+        if not admitted: # a retry that skipped admission but has to run after all (the original failed)
+            try:
+                _admit(req)
+            except Overloaded as e:
+                yield _sse("error", {"detail": OVERLOADED_DETAIL, "status": e.status, "retry_after": e.retry_after})
+                return
+        async with conversation_locks.hold(req.conversation_id):
+            conversation_id, state, is_new = await _load_conversation(req)
+            if is_new and req.message.strip() == "":
+                await _save_conversation(conversation_id, state)
+                yield _sse("conversation", {"conversation_id": conversation_id})
+                done_frame = _sse("done", ChatResponse(
+                    conversation_id=conversation_id,
+                    current_agent=state["current_agent"],
+                    messages=[],
+                    events=[],
+                    **_sync_fields(state, None, 0, None),
+                    guardrails=[],
+                ))
+                yield done_frame
+            else:
+                async for frame in _stream_turn(conversation_id, state, req.message, timings, req.cursor):
+                    if frame.startswith("event: done\n"):
+                        done_frame = frame
+                    yield frame
+    finally: # runs on completion, errors and client disconnects alike
+        if key:
+            if done_frame is not None:
+                idempotency_cache.complete(key, done_frame)
+            else:
+                idempotency_cache.fail(key)
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest, timings: bool = False, idempotency_key: Optional[str] = Header(None)):
+    """
+    Streaming variant of /chat. Emits Server-Sent Events as the run progresses,
+    so the client can render tokens before the full multi-agent run completes.
+    The final `done` frame carries the same payload as /chat (without events,
+    which were already streamed).
+    """
+    key = _idempotency_key("stream", req, idempotency_key)
+    admitted = key is None or key not in idempotency_cache # retries of a known turn replay it without admission
+    if admitted:
+        _admit(req)
+    return StreamingResponse(
+        _serialized_stream(req, timings, key, admitted),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
+
+# =========================
+# Agent catalog
+# =========================
+
+@app.get("/agents")
+async def agents_endpoint(request: Request):
+    """The static agent graph (names, handoffs, tools, guardrails), cacheable and revalidated by ETag."""
+    _, body, etag = _agents_catalog()
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=300"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# =========================
+# Metrics
+# =========================
+
+# conversation store stats of the current scrape; metrics_endpoint fetches them off the event loop
+# (the sqlite store scans the table under the lock its saves hold) before the collectors run
+_store_stats: Dict[str, Any] = {}
+
+def _collect_metrics():
+    yield (
+        "telco_conversation_store", "gauge", "Conversation store size metrics.",
+        [({"stat": k}, v) for k, v in _store_stats.items() if isinstance(v, (int, float))],
+    )
+    yield (
+        "telco_embedding_cache", "gauge", "Embedding cache hit/miss counters and tier sizes.",
+        [({"stat": k}, v) for k, v in get_embedding_cache().stats().items()],
+    )
+    yield (
+        "telco_guardrail_decisions_total", "counter", "Guardrail verdicts by deciding stage.",
+        [({"guardrail": g, "decided_by": path}, n) for (g, path), n in decision_counts.items()],
+    )
+    yield (
+        "telco_guardrail_verdict_cache_items", "gauge", "Cached LLM guardrail verdicts.",
+        [({}, len(guardrail_verdict_cache))],
+    )
+    yield (
+        "telco_guardrail_classifier_total", "counter", "Local guardrail classifier outcomes (escalated = sent on to the LLM).",
+        [({"guardrail": g, "outcome": outcome}, n) for (g, outcome), n in classifier_counts.items()],
+    )
+    yield (
+        "telco_guardrail_escalation_rate", "gauge", "Share of classifier-checked messages escalated to the LLM guardrail.",
+        [
+            ({"guardrail": g}, classifier_counts[(g, "escalated")] / total)
+            for g in {g for g, _ in classifier_counts}
+            if (total := classifier_counts[(g, "escalated")] + classifier_counts[(g, "decided")])
+        ],
+    )
+    if answer_cache is not None:
+        yield (
+            "telco_answer_cache", "gauge", "Semantic answer cache: items, hits, misses, stores, invalidations and hit rate.",
+            [({"stat": k}, v) for k, v in answer_cache.stats().items()],
+        )
+    yield (
+        "telco_faq_lookups_total", "counter", "FAQ lookups by route (lexical = embedding call skipped).",
+        [({"route": route}, n) for route, n in faq_route_counts.items()],
+    )
+    yield (
+        "telco_duplicate_requests_total", "counter", "Retried requests served without a new run, by outcome.",
+        [({"outcome": "replayed"}, idempotency_cache.replays), ({"outcome": "joined"}, idempotency_cache.joins)],
+    )
+    yield (
+        "telco_conversation_lock_waits_total", "counter", "Turns that queued behind another turn of the same conversation.",
+        [({}, conversation_locks.waits)],
+    )
+    yield (
+        "telco_plan_writes", "gauge", "Plan record group commit: queued records, flushes, records written, failed records.",
+        [({"stat": k}, v) for k, v in plan_writes.stats().items()],
+    )
+    yield (
+        "telco_backoffice_rows_total", "counter", "Back-office bulk rows processed, by operation and outcome.",
+        [({"operation": op, "status": status}, n) for (op, status), n in backoffice_row_counts.items()],
+    )
+    yield (
+        "telco_backoffice_rows_per_second", "gauge", "Throughput of the last back-office job, by operation.",
+        [({"operation": op}, rate) for op, rate in last_rows_per_second.items()],
+    )
+    yield (
+        "telco_scheduler", "gauge", "Outbound call scheduler: in-flight calls, queue depth by priority, token budget.",
+        [({"stat": k}, v) for k, v in call_scheduler.stats().items()],
+    )
+    yield (
+        "telco_scheduler_rejections_total", "counter", "Outbound calls and requests shed by the scheduler.",
+        [({"priority": p, "reason": r}, n) for (p, r), n in call_scheduler.rejections.items()],
+    )
+
+    yield (
+        "telco_startup_seconds", "gauge", "Time to import the app and to warm up its resources.",
+        [({"phase": phase}, startup[f"{phase}_seconds"]) for phase in ("import", "warm_up") if startup[f"{phase}_seconds"] is not None]
+        + [({"phase": f"resource_{name}"}, seconds) for name, seconds in startup["resources"].items()],
+    )
+    yield ("telco_ready", "gauge", "1 once warm-up has completed.", [({}, int(startup["ready"]))])
+
+register_collector(_collect_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus-style metrics: span/request latency histograms plus cache, store and guardrail counters."""
+    stats = await _store_call(get_conversation_store().stats)
+    _store_stats.clear()
+    _store_stats.update(stats)
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+# =========================
+# Health
+# =========================
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once warm-up has completed, 503 before that (or if it failed)."""
+    body = {
+        "ready": startup["ready"],
+        "error": startup["error"],
+        "import_seconds": startup["import_seconds"],
+        "warm_up_seconds": startup["warm_up_seconds"],
+        "resources": startup["resources"],
+    }
+    return JSONResponse(status_code=200 if startup["ready"] else 503, content=body)
@@ -0,0 +1,238 @@
+import csv
+import hmac
+import io
+import json
+import os
+import time
+from collections import Counter
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from main import check_plan_name, get_plans_repo, recommend_plan, run_blocking
+from telemetry import histogram
+
+# =========================
+# Back-office bulk API
+# =========================
+# Non-conversational batch endpoints for operations staff: look up, apply or cancel roaming plans for
+# many numbers at once. Uploads are NDJSON (one object per line) or CSV with a header row
+# (Content-Type: text/csv). Results stream back as NDJSON: one line per input row, in input order,
+# then a summary line. Rows are processed in chunks of CHUNK_ROWS. Each chunk needs one SELECT for
+# the current plans and one transaction for its writes. Plan names and destinations are validated
+# with the same helpers as the agent tools.
+
+BACKOFFICE_TOKEN = os.environ.get("BACKOFFICE_TOKEN")
+CHUNK_ROWS = int(os.environ.get("BACKOFFICE_CHUNK_ROWS", 1000))
+
+# (operation, "ok" | "error") -> rows, and rows per second of the last job per operation
+row_counts: Counter = Counter()
+last_rows_per_second: Dict[str, float] = {}
+chunk_seconds = histogram("telco_backoffice_chunk_seconds", "Time to process one chunk of back-office rows.")
+
+Row = Tuple[int, Optional[Dict[str, Any]], Optional[str]] # (line number, fields, parse error)
+
+
+def require_token(authorization: Optional[str] = Header(None)) -> None:
+    """Bearer BACKOFFICE_TOKEN; without a configured token the back-office api is disabled."""
+    if not BACKOFFICE_TOKEN:
+        raise HTTPException(status_code=403, detail="Back-office API is disabled; set BACKOFFICE_TOKEN to enable it.")
+    if not hmac.compare_digest(authorization or "", f"Bearer {BACKOFFICE_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid back-office token.")
+
+router = APIRouter(prefix="/backoffice", dependencies=[Depends(require_token)])
+
+# =========================
+# Parsing
+# =========================
+
+def _parse_rows(text: str, is_csv: bool) -> Iterator[Row]:
+    """Lazily parsed rows; each chunk is pulled from this on the io thread pool (see _next_chunk)."""
+    if is_csv:
+        reader = csv.DictReader(io.StringIO(text))
+        if reader.fieldnames is not None:
+            reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+        for fields in reader:
+            if any(v for v in fields.values() if isinstance(v, str) and v.strip()):
+                yield reader.line_num, fields, None
+        return
+    for line_no, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            fields = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, None, f"invalid json: {e.msg}"
+            continue
+        if not isinstance(fields, dict):
+            yield line_no, None, "expected a json object"
+            continue
+        yield line_no, fields, None
+
+def _text(fields: Dict[str, Any], name: str) -> Optional[str]:
+    value = fields.get(name)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def _destinations(fields: Dict[str, Any]) -> List[str]:
+    value = fields.get("destinations")
+    if isinstance(value, list):
+        return [str(d) for d in value if str(d).strip()]
+    return [d for d in str(value or "").replace("|", ";").split(";") if d.strip()] # csv: "japan;korea"
+
+def _error(line: int, message: str, fields: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    result = {"line": line, "status": "error", "error": message}
+    if fields and _text(fields, "phone_number"):
+        result["phone_number"] = _text(fields, "phone_number")
+    return result
+
+def _customer(fields: Dict[str, Any], line: int) -> Tuple[Optional[Tuple[str, str]], Optional[Dict[str, Any]]]:
+    """(phone_number, customer_name), or an error result when either is missing."""
+    phone, name = _text(fields, "phone_number"), _text(fields, "customer_name")
+    if phone is None or name is None:
+        return None, _error(line, "phone_number and customer_name are required", fields)
+    return (phone, name), None
+
+# =========================
+# Operations (one chunk at a time, on the io thread pool)
+# =========================
+
+def _lookup_chunk(rows: List[Row]) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    keys, slots = [], []
+    for line, fields, error in rows:
+        phone = _text(fields, "phone_number") if fields else None
+        if error or phone is None:
+            results.append(_error(line, error or "phone_number is required", fields))
+            continue
+        keys.append((phone, _text(fields, "customer_name")))
+        slots.append(len(results))
+        results.append({"line": line, "status": "ok", "phone_number": phone})
+    for slot, record in zip(slots, get_plans_repo().latest_plans(keys)):
+        results[slot].update(
+            customer_name=record.customer_name if record else None,
+            roaming_plan=record.roaming_plan if record else None,
+            since=record.timestamp if record else None,
+        )
+    return results
+
+def _plan_for(fields: Dict[str, Any]) -> str:
+    """The canonical plan for a purchase row: its `plan`, or the smallest plan covering its `destinations`."""
+    if _text(fields, "plan"):
+        return check_plan_name(_text(fields, "plan"))
+    destinations = _destinations(fields)
+    if not destinations:
+        raise ValueError("plan or destinations is required")
+    plan = recommend_plan(destinations)
+    if plan is None:
+        raise ValueError("no roaming plan covers all destinations")
+    return check_plan_name(plan)
+
+def _purchase_chunk(rows: List[Row]) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    writes = []
+    for line, fields, error in rows:
+        if error:
+            results.append(_error(line, error))
+            continue
+        key, failed = _customer(fields, line)
+        if failed:
+            results.append(failed)
+            continue
+        try:
+            plan = _plan_for(fields)
+        except ValueError as e: # one bad row is reported on its own line; the rest of the chunk goes ahead
+            results.append(_error(line, str(e), fields))
+            continue
+        phone, name = key
+        writes.append((name, phone, plan))
+        results.append({"line": line, "status": "ok", "phone_number": phone, "customer_name": name, "roaming_plan": plan})
+    if writes:
+        get_plans_repo().record_plans(writes)
+    return results
+
+def _cancel_chunk(rows: List[Row]) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    parsed = []
+    for line, fields, error in rows:
+        if error:
+            results.append(_error(line, error))
+            continue
+        key, failed = _customer(fields, line)
+        if failed:
+            results.append(failed)
+            continue
+        parsed.append((len(results), key))
+        results.append({"line": line, "status": "ok", "phone_number": key[0], "customer_name": key[1]})
+    current = {key: record.roaming_plan if record else None
+               for (_, key), record in zip(parsed, get_plans_repo().latest_plans([k for _, k in parsed]))}
+    writes = []
+    for slot, (phone, name) in parsed:
+        plan = current[(phone, name)]
+        if plan is None: # same rule as roaming_cancellation_tool
+            results[slot] = _error(results[slot]["line"], "no roaming plan existing", {"phone_number": phone})
+            continue
+        current[(phone, name)] = None # a repeated row in the same upload finds it already cancelled
+        writes.append((name, phone, None))
+        results[slot]["previous_plan"] = plan
+    if writes:
+        get_plans_repo().record_plans(writes)
+    return results
+
+def _next_chunk(rows: Iterator[Row], process: Callable[[List[Row]], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Parse and process the next CHUNK_ROWS rows ([] once the upload is exhausted)."""
+    chunk = list(islice(rows, CHUNK_ROWS))
+    return process(chunk) if chunk else []
+
+# =========================
+# Endpoints
+# =========================
+
+async def _run_job(operation: str, rows: Iterator[Row], process: Callable[[List[Row]], List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    start = time.perf_counter()
+    counts: Counter = Counter()
+    while True:
+        chunk_start = time.perf_counter()
+        results = await run_blocking(_next_chunk, rows, process)
+        if not results:
+            break
+        chunk_seconds.observe(time.perf_counter() - chunk_start, operation=operation)
+        for result in results:
+            counts[result["status"]] += 1
+        yield "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in results).encode("utf-8")
+    seconds = time.perf_counter() - start
+    total = counts["ok"] + counts["error"]
+    for status, n in counts.items():
+        row_counts[(operation, status)] += n
+    last_rows_per_second[operation] = total / seconds if seconds > 0 else 0.0
+    summary = {"rows": total, "ok": counts["ok"], "errors": counts["error"], "seconds": round(seconds, 3),
+               "rows_per_second": round(last_rows_per_second[operation], 1)}
+    yield (json.dumps({"summary": summary}) + "\n").encode("utf-8")
+
+async def _bulk(request: Request, operation: str, process) -> StreamingResponse:
+    body = await request.body()
+    try: # before the response starts: once the 200 headers are out an error can only truncate the stream
+        text = await run_blocking(body.decode, "utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Upload is not valid UTF-8 (byte {e.start}).")
+    rows = _parse_rows(text, "csv" in request.headers.get("content-type", ""))
+    return StreamingResponse(_run_job(operation, rows, process), media_type="application/x-ndjson")
+
+@router.post("/plans/lookup")
+async def bulk_lookup(request: Request):
+    """Current plan per row: phone_number, optionally customer_name (otherwise the latest record for the number)."""
+    return await _bulk(request, "lookup", _lookup_chunk)
+
+@router.post("/plans/purchase")
+async def bulk_purchase(request: Request):
+    """Apply a plan per row: phone_number, customer_name, and plan or destinations (the smallest covering plan)."""
+    return await _bulk(request, "purchase", _purchase_chunk)
+
+@router.post("/plans/cancel")
+async def bulk_cancel(request: Request):
+    """Cancel the current plan per row: phone_number, customer_name."""
+    return await _bulk(request, "cancel", _cancel_chunk)
@@ -0,0 +1,2 @@
+# Package initializer
+__all__ = []
@@ -0,0 +1,237 @@
+import asyncio
+import base64
+import gzip
+import hashlib
+import json
+import os
+import time
+from array import array
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from agents.items import ModelResponse
+from agents.models.interface import Model, ModelProvider
+from agents.usage import Usage
+from openai.types.responses import ResponseCompletedEvent, ResponseOutputItem
+from pydantic import TypeAdapter
+
+from bench.stub_provider import stream_events
+
+# =========================
+# Record/replay cassettes for model and embedding calls
+# =========================
+# Record mode wraps the real provider/client and appends one json line per call (request key,
+# response, latency) to the cassette. Replay mode serves the calls from the cassette
+# deterministically, sleeping for the recorded latency scaled by `time_scale`.
+# Files ending in .gz are gzip-compressed.
+
+_output_adapter = TypeAdapter(ResponseOutputItem)
+
+class CassetteMiss(LookupError):
+    """A replayed run made a call that is not in the cassette."""
+
+
+def request_key(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, default=str, sort_keys=True).encode("utf-8")).hexdigest()[:24]
+
+def _model_request_key(model_name: str, system_instructions, input, tools, output_schema, handoffs) -> str:
+    return request_key(
+        model_name,
+        system_instructions,
+        input,
+        sorted(getattr(t, "name", "") for t in tools or []),
+        sorted(getattr(h, "tool_name", "") for h in handoffs or []),
+        output_schema.name() if output_schema is not None else None,
+    )
+
+def _pack_vector(vector: List[float]) -> str:
+    return base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+
+def _unpack_vector(packed: str) -> List[float]:
+    return array("f", base64.b64decode(packed)).tolist()
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str):
+        assert mode in ("record", "replay"), "cassette mode must be `record` or `replay`"
+        self.path = path
+        self.mode = mode
+        self._file = None
+        # replay: exact request key -> records, plus per-kind/model order for calls whose key drifted
+        self._by_key: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._by_model: Dict[tuple, Deque[Dict[str, Any]]] = defaultdict(deque)
+        if mode == "replay":
+            for record in self._read():
+                self._by_key[record["key"]].append(record)
+                self._by_model[(record["kind"], record["model"])].append(record)
+
+    def _open(self, mode: str):
+        return gzip.open(self.path, mode + "t", encoding="utf-8") if self.path.endswith(".gz") \
+            else open(self.path, mode, encoding="utf-8")
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"cassette not found: {self.path}")
+        with self._open("r") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def append(self, record: Dict[str, Any]) -> None:
+        if self._file is None:
+            self._file = self._open("a")
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def take(self, kind: str, model: str, key: str) -> Dict[str, Any]:
+        """Next recorded response for this request (exact match first, then recording order)."""
+        exact = self._by_key.get(key)
+        record = exact.popleft() if exact else None
+        ordered = self._by_model.get((kind, model))
+        if record is None:
+            if not ordered:
+                raise CassetteMiss(f"no recorded {kind} call left for {model}")
+            record = ordered.popleft()
+            if record in self._by_key.get(record["key"], ()):
+                self._by_key[record["key"]].remove(record)
+        elif ordered and record in ordered:
+            ordered.remove(record)
+        return record
+
+
+# =========================
+# Model calls
+# =========================
+
+def _dump_response(output: List[Any], usage: Optional[Usage]) -> Dict[str, Any]:
+    return {
+        "output": [item.model_dump(mode="json", exclude_none=True) for item in output],
+        "usage": {
+            "requests": getattr(usage, "requests", 1),
+            "input_tokens": getattr(usage, "input_tokens", 0),
+            "output_tokens": getattr(usage, "output_tokens", 0),
+            "total_tokens": getattr(usage, "total_tokens", 0),
+        },
+    }
+
+def _load_response(record: Dict[str, Any]) -> ModelResponse:
+    usage = Usage()
+    for k, v in record.get("usage", {}).items():
+        setattr(usage, k, v)
+    output = [_output_adapter.validate_python(item) for item in record["output"]]
+    return ModelResponse(output=output, usage=usage, response_id=None)
+
+
+class RecordingModel(Model):
+    def __init__(self, inner: Model, model_name: str, cassette: Cassette):
+        self.inner = inner
+        self.model_name = model_name
+        self.cassette = cassette
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, *args, **kwargs):
+        key = _model_request_key(self.model_name, system_instructions, input, tools, output_schema, handoffs)
+        start = time.perf_counter()
+        response = await self.inner.get_response(system_instructions, input, model_settings, tools, output_schema, handoffs, *args, **kwargs)
+        self.cassette.append({
+            "kind": "model", "model": self.model_name, "key": key, "latency": time.perf_counter() - start,
+            **_dump_response(response.output, response.usage),
+        })
+        return response
+
+    async def stream_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, *args, **kwargs) -> AsyncIterator[Any]:
+        key = _model_request_key(self.model_name, system_instructions, input, tools, output_schema, handoffs)
+        start = time.perf_counter()
+        async for event in self.inner.stream_response(system_instructions, input, model_settings, tools, output_schema, handoffs, *args, **kwargs):
+            if isinstance(event, ResponseCompletedEvent):
+                self.cassette.append({
+                    "kind": "model", "model": self.model_name, "key": key, "latency": time.perf_counter() - start,
+                    **_dump_response(event.response.output, None),
+                })
+            yield event
+
+
+class ReplayModel(Model):
+    def __init__(self, model_name: str, cassette: Cassette, time_scale: float):
+        self.model_name = model_name
+        self.cassette = cassette
+        self.time_scale = time_scale
+
+    async def _take(self, system_instructions, input, tools, output_schema, handoffs) -> Dict[str, Any]:
+        key = _model_request_key(self.model_name, system_instructions, input, tools, output_schema, handoffs)
+        record = self.cassette.take("model", self.model_name, key)
+        if self.time_scale > 0:
+            await asyncio.sleep(record["latency"] * self.time_scale)
+        return record
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, *args, **kwargs):
+        return _load_response(await self._take(system_instructions, input, tools, output_schema, handoffs))
+
+    async def stream_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, *args, **kwargs) -> AsyncIterator[Any]:
+        response = _load_response(await self._take(system_instructions, input, tools, output_schema, handoffs))
+        for event in stream_events(response.output):
+            yield event
+
+
+class CassetteModelProvider(ModelProvider):
+    """Records calls made through `inner` (record mode) or serves them from the cassette (replay mode)."""
+
+    def __init__(self, cassette: Cassette, inner: Optional[ModelProvider] = None, time_scale: float = 1.0):
+        assert cassette.mode == "replay" or inner is not None, "record mode needs a provider to record"
+        self.cassette = cassette
+        self.inner = inner
+        self.time_scale = time_scale
+
+    def get_model(self, model_name: str | None) -> Model:
+        name = model_name or "default"
+        if self.cassette.mode == "record":
+            return RecordingModel(self.inner.get_model(model_name), name, self.cassette)
+        return ReplayModel(name, self.cassette, self.time_scale)
+
+
+# =========================
+# Embedding calls
+# =========================
+
+class _Embedding:
+    def __init__(self, embedding: List[float], index: int):
+        self.embedding = embedding
+        self.index = index
+
+class _EmbeddingResponse:
+    def __init__(self, data: List[_Embedding]):
+        self.data = data
+
+class CassetteEmbeddings:
+    def __init__(self, cassette: Cassette, inner=None, time_scale: float = 1.0):
+        self.cassette = cassette
+        self.inner = inner
+        self.time_scale = time_scale
+
+    async def create(self, model: str, input, encoding_format: str = "float", **kwargs):
+        key = request_key(model, input)
+        if self.cassette.mode == "record":
+            start = time.perf_counter()
+            response = await self.inner.create(model=model, input=input, encoding_format=encoding_format, **kwargs)
+            self.cassette.append({
+                "kind": "embedding", "model": model, "key": key, "latency": time.perf_counter() - start,
+                "vectors": [_pack_vector(d.embedding) for d in sorted(response.data, key=lambda d: d.index)],
+            })
+            return response
+        record = self.cassette.take("embedding", model, key)
+        if self.time_scale > 0:
+            await asyncio.sleep(record["latency"] * self.time_scale)
+        return _EmbeddingResponse([_Embedding(_unpack_vector(v), i) for i, v in enumerate(record["vectors"])])
+
+class CassetteOpenAI:
+    """Stands in for AsyncOpenAI in main.py: only `embeddings.create` is used there."""
+
+    def __init__(self, cassette: Cassette, inner=None, time_scale: float = 1.0):
+        self.embeddings = CassetteEmbeddings(cassette, getattr(inner, "embeddings", None), time_scale)
+
+
+def cassette_from_env() -> Optional[Cassette]:
+    """TELCO_CASSETTE=<path> with TELCO_CASSETTE_MODE=record|replay enables cassettes."""
+    path = os.environ.get("TELCO_CASSETTE")
+    if not path:
+        return None
+    return Cassette(path, os.environ.get("TELCO_CASSETTE_MODE", "replay"))
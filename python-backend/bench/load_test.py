@@ -0,0 +1,152 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+# Offline load test: drives concurrent scripted conversations through the real api.py app
+# (in-process, over ASGI) with the stub model provider and stub embeddings.
+# usage (from python-backend/):
+#   python -m bench.load_test --conversations 200 --concurrency 50 --model-latency 0.3
+
+SCRIPTS: List[List[str]] = [
+    [ # purchase flow
+        "Hi",
+        "I would like to buy a roaming plan",
+        "My name is John Smith and my phone number is 91111111",
+        "I am travelling to Japan and Korea, which plan is suitable?",
+        "Please help me purchase the plan",
+        "Yes that is correct",
+        "Thanks",
+    ],
+    [ # faq flow
+        "Hello",
+        "John Tan, 92222222",
+        "I have some questions about roaming",
+        "Does the data roaming plan cover calls and SMS?",
+        "How can I check my data usage?",
+        "ok",
+    ],
+    [ # cancellation flow
+        "Hi, I would like to check on my roaming plan",
+        "Mary Lim, 93333333",
+        "I would like to cancel my roaming plan",
+        "That is correct",
+        "bye",
+    ],
+]
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+
+async def run_conversation(client, script: List[str], latencies: List[float], errors: List[str]) -> None:
+    conversation_id = ""
+    for message in script:
+        start = time.perf_counter()
+        try:
+            res = await client.post("/chat", json={"conversation_id": conversation_id, "message": message})
+            res.raise_for_status()
+            conversation_id = res.json()["conversation_id"]
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {e}")
+            return
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+
+async def main(args) -> Dict[str, Any]:
+    import httpx
+    import api # imported after the environment is configured
+
+    random.seed(args.seed)
+    latencies: List[float] = []
+    errors: List[str] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def worker(i: int, client) -> None:
+        async with semaphore:
+            await run_conversation(client, SCRIPTS[i % len(SCRIPTS)], latencies, errors)
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    transport = httpx.ASGITransport(app=api.app)
+    # ASGITransport does not send lifespan events, so run the app's startup/shutdown around the test
+    async with api.app.router.lifespan_context(api.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            ready = (await client.get("/readyz")).json()
+            start = time.perf_counter()
+            await asyncio.gather(*[worker(i, client) for i in range(args.conversations)])
+            elapsed = time.perf_counter() - start
+        store_stats = api.get_conversation_store().stats()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+
+    return {
+        "conversations": args.conversations,
+        "concurrency": args.concurrency,
+        "model_latency_s": args.model_latency,
+        "turns": len(latencies),
+        "errors": len(errors),
+        "wall_s": round(elapsed, 3),
+        "throughput_turns_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+        },
+        "retained_bytes_per_conversation": retained // max(1, args.conversations),
+        "startup_s": {"import": ready["import_seconds"], "warm_up": ready["warm_up_seconds"]},
+        "conversation_store": store_stats,
+        "sample_errors": errors[:5],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test for api.py using the stub model provider.")
+    parser.add_argument("--conversations", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--model-latency", type=float, default=0.3, help="seconds per stubbed model call")
+    parser.add_argument("--model-jitter", type=float, default=0.1)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per stubbed embeddings call")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as json")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="telco-bench-")
+    os.environ.update({
+        "TELCO_MODEL_PROVIDER": "stub",
+        "STUB_MODEL_LATENCY": str(args.model_latency),
+        "STUB_MODEL_JITTER": str(args.model_jitter),
+        "STUB_EMBED_LATENCY": str(args.embed_latency),
+        "PLANS_DB": os.path.join(workdir, "roaming_plans.db"),
+        "EMBED_CACHE_PATH": os.path.join(workdir, "embedding_cache.db"),
+        "CONVERSATION_DB": os.path.join(workdir, "conversations.db"),
+    })
+    sys.path.insert(0, os.getcwd())
+
+    report = asyncio.run(main(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        lat = report["latency_ms"]
+        print(f"{report['turns']} turns over {report['conversations']} conversations "
+              f"(concurrency {report['concurrency']}, stub model latency {report['model_latency_s']}s)")
+        print(f"wall {report['wall_s']}s, throughput {report['throughput_turns_per_s']} turns/s, errors {report['errors']}")
+        print(f"latency ms: mean {lat['mean']}, p50 {lat['p50']}, p95 {lat['p95']}, p99 {lat['p99']}")
+        print(f"retained memory per conversation: {report['retained_bytes_per_conversation']} bytes")
+        print(f"startup: import {report['startup_s']['import']:.2f}s, warm-up {report['startup_s']['warm_up']:.2f}s")
+        for err in report["sample_errors"]:
+            print(f"  error: {err}")
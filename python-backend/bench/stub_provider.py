@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+from itertools import count
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from agents.models.interface import Model, ModelProvider
+from agents.items import ModelResponse
+from agents.usage import Usage
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseFunctionToolCall,
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseTextDeltaEvent,
+)
+
+# =========================
+# Offline stub model provider & embeddings
+# =========================
+# Stands in for the OpenAI API so the real api.py app can be driven without credits.
+# Responses are scripted from the latest user message and the tools/handoffs on offer,
+# so conversations exercise guardrails, handoffs, tool calls and tool outputs.
+
+_ids = count()
+
+def _next_id(prefix: str) -> str:
+    return f"{prefix}_stub{next(_ids)}"
+
+def message_item(text: str) -> ResponseOutputMessage:
+    return ResponseOutputMessage(
+        id=_next_id("msg"),
+        type="message",
+        role="assistant",
+        status="completed",
+        content=[ResponseOutputText(type="output_text", text=text, annotations=[])],
+    )
+
+def tool_call_item(name: str, arguments: Dict[str, Any]) -> ResponseFunctionToolCall:
+    return ResponseFunctionToolCall(
+        id=_next_id("fc"),
+        call_id=_next_id("call"),
+        type="function_call",
+        name=name,
+        arguments=json.dumps(arguments),
+        status="completed",
+    )
+
+def stream_events(output: List[Any], usage: Optional[Usage] = None) -> List[Any]:
+    """Minimal event sequence for a streamed response: text deltas, then response.completed."""
+    events: List[Any] = []
+    seq = count()
+    for index, item in enumerate(output):
+        if isinstance(item, ResponseOutputMessage):
+            for part in item.content:
+                for chunk in re.findall(r"\S+\s*", getattr(part, "text", "")):
+                    events.append(ResponseTextDeltaEvent.model_construct(
+                        type="response.output_text.delta", item_id=item.id, output_index=index,
+                        content_index=0, delta=chunk, logprobs=[], sequence_number=next(seq),
+                    ))
+    response = Response.model_construct(
+        id=_next_id("resp"), object="response", created_at=0, model="stub", output=output,
+        tool_choice="auto", tools=[], parallel_tool_calls=False, usage=None,
+    )
+    events.append(ResponseCompletedEvent.model_construct(
+        type="response.completed", response=response, sequence_number=next(seq),
+    ))
+    return events
+
+
+def _latest_user_text(input: Any) -> str:
+    if isinstance(input, str):
+        return input
+    for item in reversed(input):
+        if isinstance(item, dict) and item.get("role") == "user":
+            content = item.get("content")
+            if isinstance(content, list):
+                return " ".join(p.get("text", "") for p in content if isinstance(p, dict))
+            return str(content)
+    return ""
+
+def _placeholder(schema: Dict[str, Any]) -> Any:
+    """A value satisfying a (simple) json schema: true for booleans, 'stub' for strings, etc."""
+    kind = schema.get("type")
+    if kind == "object":
+        return {k: _placeholder(v) for k, v in schema.get("properties", {}).items()}
+    if kind == "array":
+        return []
+    return {"boolean": True, "string": "stub", "integer": 0, "number": 0.0}.get(kind)
+
+DESTINATIONS = ["japan", "australia", "new zealand", "malaysia", "thailand", "korea", "usa", "uk", "france", "china"]
+
+
+class StubModel(Model):
+    """Scripted model with configurable latency (seconds, uniformly jittered)."""
+
+    def __init__(self, model_name: str, latency: float = 0.3, jitter: float = 0.1):
+        self.model_name = model_name
+        self.latency = latency
+        self.jitter = jitter
+
+    def _script(self, input: Any, tools: List[Any], output_schema: Any, handoffs: List[Any]) -> List[Any]:
+        if output_schema is not None: # guardrails / structured output
+            return [message_item(json.dumps(_placeholder(output_schema.json_schema())))]
+        if not isinstance(input, str) and input and isinstance(input[-1], dict) \
+                and input[-1].get("type") == "function_call_output":
+            return [message_item(f"Here is what I found: {str(input[-1].get('output'))[:200]}")]
+
+        text = _latest_user_text(input).lower()
+        tool_names = {getattr(t, "name", "") for t in tools}
+        handoff_names = {getattr(h, "tool_name", "") for h in handoffs}
+        digits = re.sub(r"\D", "", text)
+
+        if "get_customer_information_tool" in tool_names and len(digits) >= 8:
+            return [tool_call_item("get_customer_information_tool", {"customer_name": "Stub Customer", "phone_number": digits[-8:]})]
+        if "roaming_plans_lookup_tool" in tool_names and any(d in text for d in DESTINATIONS):
+            return [tool_call_item("roaming_plans_lookup_tool", {"destinations": [d for d in DESTINATIONS if d in text]})]
+        if "roaming_faq_lookup_tool" in tool_names and "?" in text:
+            return [tool_call_item("roaming_faq_lookup_tool", {"question": text})]
+        if "purchase_roaming_tool" in tool_names and ("yes" in text or "correct" in text):
+            return [tool_call_item("purchase_roaming_tool", {"new_roaming_plan": "Asia"})]
+        if "roaming_cancellation_tool" in tool_names and ("yes" in text or "correct" in text):
+            return [tool_call_item("roaming_cancellation_tool", {})]
+        for keyword, target in (("cancel", "cancellation_agent"), ("buy", "purchase_agent"),
+                                ("purchase", "purchase_agent"), ("roam", "roaming_agent"), ("travel", "roaming_agent")):
+            handoff_tool = f"transfer_to_{target}"
+            if keyword in text and handoff_tool in handoff_names:
+                return [tool_call_item(handoff_tool, {})]
+        return [message_item("Sure, I can help with that. Could you tell me a bit more about what you need?")]
+
+    async def _delay(self) -> None:
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, *args, **kwargs):
+        await self._delay()
+        output = self._script(input, tools, output_schema, handoffs)
+        usage = Usage()
+        usage.requests = 1
+        usage.input_tokens = len(json.dumps(input, default=str)) // 4
+        usage.output_tokens = 20
+        usage.total_tokens = usage.input_tokens + usage.output_tokens
+        return ModelResponse(output=output, usage=usage, response_id=None)
+
+    async def stream_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, *args, **kwargs) -> AsyncIterator[Any]:
+        await self._delay()
+        for event in stream_events(self._script(input, tools, output_schema, handoffs)):
+            yield event
+
+
+class StubModelProvider(ModelProvider):
+    def __init__(self, latency: float = 0.3, jitter: float = 0.1):
+        self.latency = latency
+        self.jitter = jitter
+
+    @classmethod
+    def from_env(cls) -> "StubModelProvider":
+        return cls(
+            latency=float(os.environ.get("STUB_MODEL_LATENCY", 0.3)),
+            jitter=float(os.environ.get("STUB_MODEL_JITTER", 0.1)),
+        )
+
+    def get_model(self, model_name: str | None) -> Model:
+        return StubModel(model_name or "stub", self.latency, self.jitter)
+
+
+# =========================
+# Embeddings
+# =========================
+
+class _Embedding:
+    def __init__(self, embedding: List[float], index: int):
+        self.embedding = embedding
+        self.index = index
+        self.object = "embedding"
+
+class _EmbeddingResponse:
+    def __init__(self, data: List[_Embedding]):
+        self.data = data
+
+def stub_vector(text: str, dim: int = 1536) -> List[float]:
+    """Deterministic unit vector derived from the text (same text, same vector)."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    v = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(x * x for x in v)) or 1.0
+    return [x / norm for x in v]
+
+class StubEmbeddings:
+    def __init__(self, latency: float = 0.05, dim: int = 1536):
+        self.latency = latency
+        self.dim = dim
+
+    async def create(self, model: str, input, encoding_format: str = "float", **kwargs) -> _EmbeddingResponse:
+        await asyncio.sleep(self.latency)
+        texts = [input] if isinstance(input, str) else list(input)
+        return _EmbeddingResponse([_Embedding(stub_vector(t, self.dim), i) for i, t in enumerate(texts)])
+
+class StubAsyncOpenAI:
+    """Just enough of AsyncOpenAI for main.py: `client.embeddings.create(...)`."""
+
+    def __init__(self, embed_latency: Optional[float] = None):
+        if embed_latency is None:
+            embed_latency = float(os.environ.get("STUB_EMBED_LATENCY", 0.05))
+        self.embeddings = StubEmbeddings(latency=embed_latency)
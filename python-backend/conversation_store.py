@@ -0,0 +1,284 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+# =========================
+# Conversation stores
+# =========================
+
+class ConcurrentUpdateError(Exception):
+    """The conversation was saved by another request (or worker) since this one loaded it."""
+
+
+class ConversationStore:
+    """
+    States carry a "version" (0 for a conversation that has not been saved yet). save() is a
+    compare-and-swap: it fails with ConcurrentUpdateError unless the stored version still equals
+    state["version"], and bumps state["version"] on success.
+    """
+
+    blocking = True # whether get()/save() do I/O (or heavy copying) and should be run off the event loop
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    def save(self, conversation_id: str, state: Dict[str, Any]):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Size/memory metrics for monitoring."""
+        return {}
+
+
+def _json_default(obj):
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(exclude_unset=True)
+    return str(obj)
+
+def encode_state(state: Dict[str, Any]) -> bytes:
+    """Serialize a conversation state to compressed json (the context model is dumped to a dict)."""
+    doc = dict(state)
+    doc["context"] = state["context"].model_dump()
+    return zlib.compress(json.dumps(doc, default=_json_default, separators=(",", ":")).encode("utf-8"))
+
+def decode_state(blob: bytes, context_factory: Callable[[Dict[str, Any]], Any]) -> Dict[str, Any]:
+    """Inverse of encode_state; `context_factory` rebuilds the context model from its dict."""
+    state = json.loads(zlib.decompress(blob))
+    state["context"] = context_factory(state["context"])
+    return state
+
+
+class InMemoryConversationStore(ConversationStore):
+    """
+    Process-local store bounded by conversation count and idle time.
+    Least recently used conversations are evicted first once `max_conversations` is reached,
+    and any conversation idle for longer than `ttl_seconds` is dropped.
+    """
+
+    blocking = False
+
+    def __init__(self, max_conversations: int = 1000, ttl_seconds: Optional[float] = 3600):
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self._conversations: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {} # json size of each conversation's input_items at its last save
+        self._approx_bytes = 0 # running total of _sizes, so stats() does not re-serialize every conversation
+        self.evictions = 0
+
+    def _expired(self, conversation_id: str, now: float) -> bool:
+        return self.ttl_seconds is not None and now - self._last_access[conversation_id] > self.ttl_seconds
+
+    def _drop(self, conversation_id: str) -> None:
+        self._conversations.pop(conversation_id, None)
+        self._last_access.pop(conversation_id, None)
+        self._approx_bytes -= self._sizes.pop(conversation_id, 0)
+        self.evictions += 1
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        state = self._conversations.get(conversation_id)
+        if state is None:
+            return None
+        now = time.monotonic()
+        if self._expired(conversation_id, now):
+            self._drop(conversation_id)
+            return None
+        self._conversations.move_to_end(conversation_id)
+        self._last_access[conversation_id] = now
+        return state
+
+    def save(self, conversation_id: str, state: Dict[str, Any]):
+        now = time.monotonic()
+        stored = self._conversations.get(conversation_id)
+        if stored is not None and stored is not state and stored.get("version", 0) != state.get("version", 0):
+            raise ConcurrentUpdateError(conversation_id)
+        state["version"] = state.get("version", 0) + 1
+        self._conversations[conversation_id] = state
+        self._conversations.move_to_end(conversation_id)
+        self._last_access[conversation_id] = now
+        size = len(json.dumps(state["input_items"], default=_json_default))
+        self._approx_bytes += size - self._sizes.get(conversation_id, 0)
+        self._sizes[conversation_id] = size
+        # evict from the least recently used end: idle conversations first, then overflow
+        while self._conversations:
+            oldest = next(iter(self._conversations))
+            if oldest == conversation_id:
+                break
+            if len(self._conversations) > self.max_conversations or self._expired(oldest, now):
+                self._drop(oldest)
+            else:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "conversations": len(self._conversations),
+            "max_conversations": self.max_conversations,
+            "evictions": self.evictions,
+            "approx_bytes": self._approx_bytes,
+        }
+
+
+class SqliteConversationStore(ConversationStore):
+    """
+    Disk-backed store. Each conversation is one row of compressed json (see encode_state),
+    loaded only when that conversation is requested, so memory use does not grow with
+    the number of stored chats and conversations survive restarts.
+    Any number of uvicorn workers (or hosts sharing the file) can use the same database:
+    saves are versioned compare-and-swaps, so a turn never silently overwrites another.
+    """
+
+    def __init__(
+        self,
+        path: str = "conversations.db",
+        context_factory: Callable[[Dict[str, Any]], Any] = dict,
+        ttl_seconds: Optional[float] = None,
+    ):
+        self.path = path
+        self.context_factory = context_factory
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000") # other workers hold the write lock briefly
+        with self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS conversations (
+                    conversation_id TEXT PRIMARY KEY,
+                    state BLOB NOT NULL,
+                    updated_at REAL NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 1
+                )
+                """
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(conversations)")}
+            if "version" not in columns: # db files from before versioning
+                self._conn.execute("ALTER TABLE conversations ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations (updated_at)")
+        self._saves = 0
+        self.conflicts = 0
+
+    def _live(self, updated_at: float) -> bool:
+        return self.ttl_seconds is None or time.time() - updated_at <= self.ttl_seconds
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, updated_at, version FROM conversations WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        if row is None or not self._live(row[1]):
+            return None
+        state = decode_state(row[0], self.context_factory)
+        state["version"] = row[2]
+        return state
+
+    def version(self, conversation_id: str) -> Optional[int]:
+        """Current stored version without loading the state (None if missing or expired)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT updated_at, version FROM conversations WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+        return row[1] if row is not None and self._live(row[0]) else None
+
+    def save(self, conversation_id: str, state: Dict[str, Any]):
+        expected = state.get("version", 0)
+        blob = encode_state(state)
+        now = time.time()
+        with self._lock, self._conn:
+            if expected == 0:
+                # first save: expired rows for the id may be replaced, live ones may not
+                cur = self._conn.execute(
+                    "INSERT INTO conversations (conversation_id, state, updated_at, version) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT(conversation_id) DO UPDATE SET state = excluded.state, "
+                    "updated_at = excluded.updated_at, version = conversations.version + 1 "
+                    "WHERE conversations.updated_at < ?",
+                    (conversation_id, blob, now, now - self.ttl_seconds if self.ttl_seconds is not None else float("-inf")),
+                )
+            else:
+                cur = self._conn.execute(
+                    "UPDATE conversations SET state = ?, updated_at = ?, version = version + 1 "
+                    "WHERE conversation_id = ? AND version = ?",
+                    (blob, now, conversation_id, expected),
+                )
+            if cur.rowcount != 1:
+                self.conflicts += 1
+                raise ConcurrentUpdateError(conversation_id)
+            version = expected + 1 if expected else self._conn.execute(
+                "SELECT version FROM conversations WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()[0]
+            self._saves += 1
+            if self.ttl_seconds is not None and self._saves % 100 == 0: # purge idle chats now and then
+                self._conn.execute("DELETE FROM conversations WHERE updated_at < ?", (now - self.ttl_seconds,))
+        state["version"] = version
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(state)), 0) FROM conversations"
+            ).fetchone()
+        return {
+            "conversations": count,
+            "stored_bytes": total,
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "conflicts": self.conflicts,
+        }
+
+
+class CachedConversationStore(ConversationStore):
+    """
+    Process-local read-through cache in front of a shared store (e.g. SqliteConversationStore).
+    A cached state is only served while its version matches the shared store's, which costs a
+    primary-key lookup instead of fetching and decoding the whole state. Callers get a copy,
+    so a turn that fails halfway never leaves a half-updated state in the cache.
+    """
+
+    def __init__(self, inner: SqliteConversationStore, max_items: int = 1000):
+        self.inner = inner
+        self.max_items = max_items
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _put(self, conversation_id: str, state: Dict[str, Any]) -> None:
+        with self._lock:
+            self._cache[conversation_id] = state
+            self._cache.move_to_end(conversation_id)
+            while len(self._cache) > self.max_items:
+                self._cache.popitem(last=False)
+
+    def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cached = self._cache.get(conversation_id)
+        if cached is not None and self.inner.version(conversation_id) == cached["version"]:
+            self.hits += 1
+            with self._lock:
+                self._cache.move_to_end(conversation_id)
+            return copy.deepcopy(cached)
+        self.misses += 1
+        state = self.inner.get(conversation_id)
+        if state is None:
+            with self._lock:
+                self._cache.pop(conversation_id, None)
+            return None
+        self._put(conversation_id, copy.deepcopy(state))
+        return state
+
+    def save(self, conversation_id: str, state: Dict[str, Any]):
+        try:
+            self.inner.save(conversation_id, state)
+        except ConcurrentUpdateError:
+            with self._lock:
+                self._cache.pop(conversation_id, None)
+            raise
+        self._put(conversation_id, copy.deepcopy(state))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.inner.stats(), "cache_items": len(self._cache), "cache_hits": self.hits, "cache_misses": self.misses}
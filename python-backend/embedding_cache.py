@@ -0,0 +1,116 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# =========================
+# Embedding cache
+# =========================
+
+def normalize_text(text: str) -> str:
+    """Normalize a query so trivially different phrasings share a cache entry."""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip("?!. ")
+
+def cache_key(text: str, model: str) -> str:
+    """Content-addressed key for (model, normalized text)."""
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache.
+    Tier 1 is an in-process LRU; tier 2 is a local SQLite file holding float32 vectors,
+    so cached embeddings survive restarts. Both tiers are size-bounded.
+    """
+
+    def __init__(self, path: str = "embedding_cache.db", max_memory_items: int = 512, max_disk_items: int = 20000):
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._disk_items = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def get(self, text: str, model: str) -> Optional[List[float]]:
+        """Return the cached embedding, or None on a miss."""
+        key = cache_key(text, model)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return vector
+
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            vector = array("f", row[0]).tolist()
+            self._remember(key, vector)
+            self.hits_disk += 1
+            return vector
+
+    def put(self, text: str, model: str, vector: List[float]) -> None:
+        """Store an embedding in both tiers, evicting the least recently used entries if full."""
+        key = cache_key(text, model)
+        with self._lock:
+            self._remember(key, vector)
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                (key, model, array("f", vector).tobytes(), time.time()),
+            )
+            self._disk_items += cur.rowcount
+            overflow = self._disk_items - self.max_disk_items
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self._disk_items -= overflow
+                self.evictions += overflow
+            self._conn.commit()
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current tier sizes."""
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_items": len(self._memory),
+            "disk_items": self._disk_items,
+        }
@@ -0,0 +1,205 @@
+import json
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# =========================
+# FAQ retrievers
+# =========================
+
+class FaqRetriever:
+    """
+    Interface for FAQ vector search.
+    search() returns up to `limit` hits as dicts with id, question, answer and score (cosine similarity).
+    """
+    blocking = True # whether search() does I/O and should be run off the event loop
+
+    def search(self, vector: Sequence[float], limit: int = 1) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """Load the index ahead of the first search (blocking)."""
+
+    def close(self) -> None:
+        pass
+
+
+class NumpyFaqRetriever(FaqRetriever):
+    """
+    In-process FAQ index for small corpora.
+    Embeddings are stored pre-normalized as a memory-mapped float32 (or int8 + per-row scale) matrix,
+    so a search is one matrix-vector product plus a top-k selection.
+    """
+    blocking = False
+
+    def __init__(self, path: str = "faq_index"):
+        with open(f"{path}.json", "r") as f:
+            meta = json.load(f)
+        self.model = meta.get("model")
+        self.entries: List[Dict[str, Any]] = meta["entries"]
+        self.vectors = np.load(f"{path}.npy", mmap_mode="r")
+        self.scales = np.asarray(meta["scales"], dtype=np.float32) if meta.get("dtype") == "int8" else None
+
+    def warm_up(self) -> None:
+        float(np.asarray(self.vectors).sum()) # page the memory-mapped matrix in
+
+    def search(self, vector: Sequence[float], limit: int = 1) -> List[Dict[str, Any]]:
+        q = np.asarray(vector, dtype=np.float32)
+        q /= np.linalg.norm(q) or 1.0
+        scores = self.vectors @ q
+        if self.scales is not None:
+            scores = scores * self.scales
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [dict(self.entries[i], score=float(scores[i])) for i in top]
+
+
+class MilvusFaqRetriever(FaqRetriever):
+    """FAQ search backed by a Milvus collection, for corpora too large to hold in memory."""
+
+    def __init__(self, client, collection_name: str = "faq"):
+        self.client = client
+        self.collection_name = collection_name
+
+    def warm_up(self) -> None:
+        self.client.load_collection(self.collection_name)
+
+    def close(self) -> None:
+        self.client.close()
+
+    def search(self, vector: Sequence[float], limit: int = 1) -> List[Dict[str, Any]]:
+        search_res = self.client.search(
+            collection_name=self.collection_name,
+            data=[list(vector)],
+            limit=limit,
+            search_params={"metric_type": "COSINE", "params": {}},  # Cosine distance
+            output_fields=["id", "question", "answer"],
+        )
+        return [
+            {
+                "id": hit["entity"].get("id", hit.get("id")),
+                "question": hit["entity"]["question"],
+                "answer": hit["entity"]["answer"],
+                "score": float(hit["distance"]),
+            }
+            for hit in search_res[0]
+        ]
+
+
+# =========================
+# Lexical (BM25) index & hybrid ranking
+# =========================
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it me my of on or so that the this to "
+    "what when where which will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class LexicalFaqIndex:
+    """
+    In-memory BM25 index over FAQ questions and answers (question terms weighted `question_weight`x).
+    Besides BM25 ranking, each hit carries `lexical`: an idf-weighted overlap (Dice) between the
+    query and the FAQ question in [0, 1], where 1.0 means the same question modulo stopwords,
+    punctuation and word order. That is what decides whether the embedding call can be skipped.
+    """
+
+    def __init__(self, entries: Iterable[Dict[str, Any]], k1: float = 1.5, b: float = 0.75, question_weight: int = 2):
+        self.k1 = k1
+        self.b = b
+        self.entries: Dict[Any, Dict[str, Any]] = {}
+        self._question_terms: Dict[Any, frozenset] = {}
+        self._postings: Dict[str, List[tuple]] = {}
+        doc_lengths: Dict[Any, int] = {}
+        for entry in entries:
+            doc_id = entry["id"]
+            self.entries[doc_id] = {"id": doc_id, "question": entry["question"], "answer": entry["answer"]}
+            question = tokenize(entry["question"])
+            self._question_terms[doc_id] = frozenset(question)
+            terms = Counter(question * question_weight + tokenize(entry["answer"]))
+            doc_lengths[doc_id] = sum(terms.values())
+            for term, tf in terms.items():
+                self._postings.setdefault(term, []).append((doc_id, tf))
+        n = max(1, len(self.entries))
+        avg_length = sum(doc_lengths.values()) / n if doc_lengths else 1.0
+        self._norm = {doc_id: k1 * (1 - b + b * length / avg_length) for doc_id, length in doc_lengths.items()}
+        self.idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self._postings.items()}
+        self._unknown_idf = math.log(1 + (n + 0.5) / 0.5) # terms absent from the corpus weigh the most
+
+    @classmethod
+    def from_faqs_json(cls, path: str = "utils/faqs.json") -> "LexicalFaqIndex":
+        """Build from the ingestion source ({"<id>": {"q": ..., "a": ...}}), with the same integer ids as the vector index."""
+        with open(path, "r") as f:
+            faqs = json.load(f)
+        return cls({"id": int(k), "question": v["q"], "answer": v["a"]} for k, v in faqs.items())
+
+    def match_quality(self, query_terms: Sequence[str], doc_id: Any) -> float:
+        query = set(query_terms)
+        question = self._question_terms.get(doc_id, frozenset())
+        weight = lambda terms: sum(self.idf.get(t, self._unknown_idf) for t in terms)
+        total = weight(query) + weight(question)
+        return 2 * weight(query & question) / total if total else 0.0
+
+    def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Top BM25 hits, each with `bm25` and `lexical` scores."""
+        terms = tokenize(query)
+        scores: Dict[Any, float] = {}
+        for term in set(terms):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, tf in self._postings[term]:
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self._norm[doc_id])
+        top = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+        return [dict(self.entries[doc_id], bm25=score, lexical=self.match_quality(terms, doc_id)) for doc_id, score in top]
+
+    def fuse(
+        self, query: str, lexical_hits: List[Dict[str, Any]], vector_hits: Optional[List[Dict[str, Any]]],
+        limit: int = 3, vector_weight: float = 0.7,
+    ) -> List[Dict[str, Any]]:
+        """
+        Merge lexical and vector candidates into one ranking by
+        score = vector_weight * cosine + (1 - vector_weight) * lexical.
+        Candidates the vector search did not return get its lowest returned cosine (an upper bound).
+        With no vector hits (embedding skipped) the score is the lexical match alone.
+        """
+        terms = tokenize(query)
+        floor = min((h["score"] for h in vector_hits), default=0.0) if vector_hits else None
+        merged: Dict[Any, Dict[str, Any]] = {}
+        for hit in vector_hits or []:
+            merged[hit["id"]] = {"id": hit["id"], "question": hit["question"], "answer": hit["answer"], "vector": hit["score"]}
+        for hit in lexical_hits:
+            merged.setdefault(hit["id"], {"id": hit["id"], "question": hit["question"], "answer": hit["answer"], "vector": floor})
+        for hit in merged.values():
+            hit["lexical"] = self.match_quality(terms, hit["id"])
+            hit["score"] = hit["lexical"] if hit["vector"] is None \
+                else vector_weight * hit["vector"] + (1 - vector_weight) * hit["lexical"]
+        return sorted(merged.values(), key=lambda h: h["score"], reverse=True)[:limit]
+
+
+def write_numpy_index(
+    path: str, entries: List[Dict[str, Any]], vectors: Sequence[Sequence[float]], model: str, quantize: bool = False
+) -> None:
+    """
+    Write a NumpyFaqRetriever index: `{path}.npy` holds the normalized embedding matrix,
+    `{path}.json` holds the FAQ entries (same row order) and, for int8, per-row scales.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    meta: Dict[str, Any] = {"model": model, "dtype": "float32", "entries": entries}
+    if quantize:
+        scales = np.maximum(np.abs(matrix).max(axis=1), 1e-12) / 127.0
+        matrix = np.round(matrix / scales[:, None]).astype(np.int8)
+        meta["dtype"] = "int8"
+        meta["scales"] = scales.tolist()
+    np.save(f"{path}.npy", matrix)
+    with open(f"{path}.json", "w") as f:
+        json.dump(meta, f)
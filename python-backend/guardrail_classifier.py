@@ -0,0 +1,119 @@
+import json
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from guardrail_fastpath import normalize_message
+
+# =========================
+# Local guardrail classifier
+# =========================
+# A linear model over hashed n-grams, distilled offline from logged LLM guardrail verdicts
+# (see utils/train_guardrail_classifier.py). It decides a guardrail on its own only when it is
+# confident; everything in between escalates to the LLM guardrail.
+
+FEATURE_DIM = 1 << 18
+_TOKEN_RE = re.compile(r"[a-z0-9']+|[^\sa-z0-9]")
+MAX_CHARS = 500 # longer messages are featurized on their first MAX_CHARS characters
+
+
+def hashed_features(text: str, dim: int = FEATURE_DIM) -> np.ndarray:
+    """Sorted unique feature ids: word unigrams and bigrams plus character 3-grams."""
+    norm = normalize_message(text)[:MAX_CHARS]
+    tokens = _TOKEN_RE.findall(norm)
+    grams = [f"w:{t}" for t in tokens]
+    grams += [f"b:{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    padded = f" {norm} "
+    grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    grams.append("len:" + str(min(len(tokens), 20) // 5)) # coarse message length bucket
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) % dim for g in grams), dtype=np.int64, count=len(grams)))
+
+
+class GuardrailClassifier:
+    """
+    Logistic regression over hashed_features(), predicting P(passed). The verdict is final when
+    P >= `pass_at` or P <= `fail_at` (both calibrated on held-out data); otherwise decide() returns None.
+    """
+
+    def __init__(self, weights: np.ndarray, bias: float, pass_at: float = 0.98, fail_at: float = 0.02):
+        self.weights = weights
+        self.bias = float(bias)
+        self.pass_at = pass_at
+        self.fail_at = fail_at
+
+    @property
+    def dim(self) -> int:
+        return len(self.weights)
+
+    @classmethod
+    def load(cls, path: str) -> "GuardrailClassifier":
+        data = np.load(path)
+        return cls(data["weights"], float(data["bias"]), float(data["pass_at"]), float(data["fail_at"]))
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f: # a file object keeps np.savez from appending .npz
+            np.savez(f, weights=self.weights.astype(np.float32), bias=self.bias, pass_at=self.pass_at, fail_at=self.fail_at)
+
+    def probability(self, text: str) -> float:
+        z = self.bias + float(self.weights[hashed_features(text, self.dim)].sum())
+        return 1.0 / (1.0 + math.exp(-min(50.0, max(-50.0, z))))
+
+    def decide(self, text: str) -> Optional[bool]:
+        """True/False when confident, None to escalate."""
+        p = self.probability(text)
+        if p >= self.pass_at:
+            return True
+        if p <= self.fail_at:
+            return False
+        return None
+
+
+def load_classifiers(model_dir: str, names: Dict[str, str]) -> Dict[str, GuardrailClassifier]:
+    """Classifiers by guardrail name, from `<model_dir>/<file>.npz`; guardrails without a model file are skipped."""
+    classifiers: Dict[str, GuardrailClassifier] = {}
+    for guardrail, file in names.items():
+        path = os.path.join(model_dir, f"{file}.npz")
+        if os.path.exists(path):
+            classifiers[guardrail] = GuardrailClassifier.load(path)
+    return classifiers
+
+
+# =========================
+# Verdict log (training data)
+# =========================
+
+class VerdictLog:
+    """Appends one json line per LLM guardrail verdict: guardrail, message text, passed, reasoning."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, guardrail: str, text: str, passed: bool, reasoning: str) -> None:
+        line = json.dumps({"ts": time.time(), "guardrail": guardrail, "text": text, "passed": passed, "reasoning": reasoning})
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_verdicts(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
@@ -0,0 +1,82 @@
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Container, Optional, Tuple
+
+# =========================
+# Guardrail pre-stage
+# =========================
+
+# short conversational messages that are always relevant and safe
+ACKNOWLEDGEMENTS = {
+    "hi", "hello", "hey", "hiya", "good morning", "good afternoon", "good evening",
+    "ok", "okay", "k", "alright", "sure", "yes", "yeah", "yep", "no", "nope", "no thanks",
+    "thanks", "thank you", "thank you so much", "thanks a lot", "cheers", "great", "cool", "got it",
+    "bye", "goodbye", "that is correct", "that's correct", "correct", "yes please", "yes that is correct",
+    "yes, that is correct", "sounds good", "perfect", "noted",
+}
+PHONE_RE = re.compile(r"^\+?\d[\d\s\-]{6,14}\d$")
+_SPLIT_RE = re.compile(r"\s*(?:,|/|&|\band\b)\s*")
+
+
+def normalize_message(text: str) -> str:
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.strip(" .!?~")
+
+
+def rule_verdict(text: str, destinations: Container[str] = ()) -> Optional[str]:
+    """
+    Cheap local rules for inputs that are obviously fine: acknowledgements, a bare phone number,
+    or a bare list of known roaming destinations. Returns the reasoning if a rule matched.
+    """
+    norm = normalize_message(text)
+    if not norm:
+        return None
+    if norm in ACKNOWLEDGEMENTS:
+        return "Conversational acknowledgement."
+    if PHONE_RE.match(norm):
+        return "Bare phone number."
+    parts = [p for p in _SPLIT_RE.split(norm) if p]
+    if parts and len(parts) <= 10 and all(p in destinations for p in parts):
+        return "List of roaming destinations."
+    return None
+
+
+class VerdictCache:
+    """Size-bounded, TTL-expiring cache of LLM guardrail verdicts keyed by (guardrail, normalized message)."""
+
+    def __init__(self, max_items: int = 5000, ttl_seconds: float = 3600):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._items: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, guardrail: str, text: str) -> Optional[Any]:
+        key = (guardrail, normalize_message(text))
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            expires, verdict = entry
+            if expires < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return verdict
+
+    def put(self, guardrail: str, text: str, verdict: Any) -> None:
+        key = (guardrail, normalize_message(text))
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl_seconds, verdict)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# how each guardrail verdict was decided:
+# (guardrail name, "rule" | "cache" | "classifier" | "llm" | "answer_cache") -> count
+decision_counts: Counter = Counter()
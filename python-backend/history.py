@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from agents import Agent, Runner, TResponseInputItem
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# History windowing & compaction
+# =========================
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+@dataclass
+class HistoryPolicy:
+    """
+    How much of state["input_items"] is re-sent to the model each turn.
+    max_turns: user turns kept verbatim (0 keeps everything).
+    compact_every: extra turns allowed to accumulate before compacting, so the prompt prefix stays
+        stable between compactions (and the summarizer is not called every turn).
+    max_tool_output_chars: tool outputs from earlier turns are truncated to this length.
+    summarize: fold dropped turns into a running summary produced by `summary_model`.
+    """
+    max_turns: int = 8
+    compact_every: int = 4
+    max_tool_output_chars: int = 400
+    summarize: bool = False
+    summary_model: str = "gpt-4.1-nano"
+
+    @classmethod
+    def from_env(cls) -> "HistoryPolicy":
+        return cls(
+            max_turns=int(os.environ.get("HISTORY_MAX_TURNS", cls.max_turns)),
+            compact_every=int(os.environ.get("HISTORY_COMPACT_EVERY", cls.compact_every)),
+            max_tool_output_chars=int(os.environ.get("HISTORY_TOOL_OUTPUT_CHARS", cls.max_tool_output_chars)),
+            summarize=os.environ.get("HISTORY_SUMMARIZE", "0") == "1",
+            summary_model=os.environ.get("HISTORY_SUMMARY_MODEL", cls.summary_model),
+        )
+
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+    def _count_tokens(text: str) -> int:
+        return len(_encoding.encode(text))
+except Exception: # tiktoken is optional; fall back to the usual ~4 chars/token estimate
+    def _count_tokens(text: str) -> int:
+        return (len(text) + 3) // 4
+
+def estimate_tokens(items: List[TResponseInputItem]) -> int:
+    """Approximate prompt tokens for a list of input items."""
+    return sum(_count_tokens(json.dumps(item, default=str)) for item in items)
+
+
+def _is_user_turn(item: Dict[str, Any]) -> bool:
+    return item.get("role") == "user" and item.get("type", "message") == "message"
+
+def _is_summary(item: Dict[str, Any]) -> bool:
+    return item.get("role") == "system" and str(item.get("content", "")).startswith(SUMMARY_PREFIX)
+
+def _truncate_tool_output(item: Dict[str, Any], limit: int) -> Dict[str, Any]:
+    output = item.get("output")
+    if item.get("type") != "function_call_output" or not isinstance(output, str) or len(output) <= limit:
+        return item
+    return dict(item, output=output[:limit] + f"... [truncated {len(output) - limit} chars]")
+
+def _render(items: List[Dict[str, Any]]) -> str:
+    """Plain-text transcript of input items for the summarizer."""
+    lines = []
+    for item in items:
+        if _is_summary(item):
+            lines.append(str(item["content"]))
+        elif item.get("type") == "function_call":
+            lines.append(f"[tool call] {item.get('name')}({item.get('arguments')})")
+        elif item.get("type") == "function_call_output":
+            lines.append(f"[tool output] {str(item.get('output'))[:200]}")
+        elif "role" in item:
+            content = item.get("content")
+            if isinstance(content, list):
+                content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+            lines.append(f"{item['role']}: {content}")
+    return "\n".join(lines)
+
+
+summary_agent = Agent(
+    name="History Summarizer",
+    instructions=(
+        "Summarize this customer service conversation in a few sentences for another agent. "
+        "Keep customer details (name, phone number), destinations, plans discussed, purchases or "
+        "cancellations made, and any open requests. Do not add anything that was not said."
+    ),
+)
+
+async def _summarize(items: List[Dict[str, Any]], model: str, run_config=None) -> str:
+    result = await Runner.run(summary_agent.clone(model=model), _render(items), run_config=run_config)
+    return str(result.final_output)
+
+
+async def compact_history(
+    items: List[TResponseInputItem], policy: HistoryPolicy, run_config=None
+) -> Tuple[List[TResponseInputItem], Dict[str, int]]:
+    """
+    Apply `policy` to the input items about to be sent to the model.
+    Returns the compacted items and a report with estimated prompt tokens before and after.
+    The window always starts at a user message, so tool calls and their outputs stay paired.
+    """
+    before = estimate_tokens(items)
+    turn_starts = [i for i, item in enumerate(items) if _is_user_turn(item)]
+    if policy.max_turns <= 0 or len(turn_starts) <= policy.max_turns + policy.compact_every:
+        return items, {"tokens_before": before, "tokens_after": before}
+
+    cut = turn_starts[-policy.max_turns]
+    dropped, kept = items[:cut], items[cut:]
+    last_turn = turn_starts[-1] - cut
+    kept = [
+        _truncate_tool_output(item, policy.max_tool_output_chars) if i < last_turn else item
+        for i, item in enumerate(kept)
+    ]
+
+    summary: Optional[str] = None
+    if policy.summarize:
+        try:
+            summary = await _summarize(dropped, policy.summary_model, run_config)
+        except Exception:
+            logger.exception("history summarization failed; dropping old turns without a summary")
+    if summary is None: # carry the previous summary forward rather than losing it
+        summary = next((str(i["content"])[len(SUMMARY_PREFIX):] for i in dropped if _is_summary(i)), None)
+    if summary:
+        kept = [{"role": "system", "content": SUMMARY_PREFIX + summary}] + kept
+
+    after = estimate_tokens(kept)
+    logger.info(f"history compacted: {len(items)} -> {len(kept)} items, ~{before} -> ~{after} tokens")
+    return kept, {"tokens_before": before, "tokens_after": after}
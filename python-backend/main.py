@@ -2,14 +2,20 @@ from __future__ import annotations as _annotations
 
 #import random
 from pydantic import BaseModel
-from typing import List
+from typing import Callable, Dict, Iterable, List, Optional
 import string
-import json
 import os
-import sqlite3
+import time
+import asyncio
+import functools
+from collections import Counter
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
 
 from agents import (
     Agent,
+    RunConfig,
+    set_tracing_disabled,
     RunContextWrapper,
     Runner,
     TResponseInputItem,
@@ -19,6 +25,11 @@ from agents import (
     input_guardrail,
 )
 from agents.extensions.handoff_prompt import RECOMMENDED_PROMPT_PREFIX
+from agents.models.multi_provider import MultiProvider
+
+from model_provider import ScheduledModelProvider, TimedModelProvider
+from scheduler import CallScheduler
+from telemetry import span, traced_tool
 
 
 # =========================
@@ -28,14 +39,161 @@ from agents.extensions.handoff_prompt import RECOMMENDED_PROMPT_PREFIX
 # RAG
 from dotenv import load_dotenv
 load_dotenv()
-assert 'OPENAI_API_KEY' in os.environ, "ERROR: set up your OPENAI_API_KEY"
-from openai import OpenAI
-openai_client = OpenAI(api_key = os.environ.get("OPENAI_API_KEY"))
-from pymilvus import MilvusClient
-milvus_client = MilvusClient("milvus.db")
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+import httpx
+
+# TELCO_MODEL_PROVIDER=stub serves scripted model and embedding responses offline (see bench/)
+STUB_PROVIDER = os.environ.get("TELCO_MODEL_PROVIDER", "openai") == "stub"
+
+# TELCO_CASSETTE=<file> records (TELCO_CASSETTE_MODE=record) or replays (=replay) every model and embedding call;
+# replayed calls sleep for the recorded latency times TELCO_CASSETTE_TIME_SCALE (0 = no waiting)
+from bench.cassette import CassetteModelProvider, CassetteOpenAI, cassette_from_env
+CASSETTE = cassette_from_env()
+CASSETTE_TIME_SCALE = float(os.environ.get("TELCO_CASSETTE_TIME_SCALE", 1.0))
+REPLAY = CASSETTE is not None and CASSETTE.mode == "replay"
+
+# one shared async client, created on first use; its connection pool is reused across all conversations in the worker
+openai_client = None
+
+def get_openai_client():
+    global openai_client
+    if openai_client is None:
+        if REPLAY:
+            openai_client = CassetteOpenAI(CASSETTE, time_scale=CASSETTE_TIME_SCALE)
+        elif STUB_PROVIDER:
+            from bench.stub_provider import StubAsyncOpenAI
+            openai_client = StubAsyncOpenAI()
+        else:
+            if 'OPENAI_API_KEY' not in os.environ:
+                raise RuntimeError("ERROR: set up your OPENAI_API_KEY")
+            openai_client = AsyncOpenAI(
+                api_key = os.environ.get("OPENAI_API_KEY"),
+                http_client = DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                ),
+            )
+        if CASSETTE is not None and not REPLAY:
+            openai_client = CassetteOpenAI(CASSETTE, inner=openai_client)
+    return openai_client
+
+# =========================
+# Resources
+# =========================
+# created on first use through the get_* accessors, so importing this module stays cheap;
+# api.py calls warm_up() at startup so the first request does not pay for it
+
+# FAQ index: in-process numpy index when one has been built (see utils/build_RAG_vdb.py --format numpy), else milvus lite
+from faq_retriever import FaqRetriever, LexicalFaqIndex, NumpyFaqRetriever, MilvusFaqRetriever
+FAQ_INDEX = os.environ.get("FAQ_INDEX", "faq_index")
+FAQ_BACKEND = os.environ.get("FAQ_BACKEND", "numpy" if os.path.exists(f"{FAQ_INDEX}.npy") else "milvus")
+FAQ_MILVUS_DB = "milvus.db" # written by utils/build_RAG_vdb.py --format milvus
+faq_retriever: Optional[FaqRetriever] = None
+
+def get_faq_retriever() -> FaqRetriever:
+    global faq_retriever
+    if faq_retriever is None:
+        if FAQ_BACKEND == "numpy":
+            faq_retriever = NumpyFaqRetriever(FAQ_INDEX)
+        else:
+            from pymilvus import MilvusClient # opening milvus lite takes a lock on milvus.db
+            faq_retriever = MilvusFaqRetriever(MilvusClient(FAQ_MILVUS_DB), collection_name="faq")
+    return faq_retriever
+
+# BM25 index over the FAQ source, searched before (and often instead of) the vector index
+FAQ_SOURCE = os.environ.get("FAQ_SOURCE", "utils/faqs.json")
+# changes when the FAQs are re-scraped or re-ingested; rebuilds the lexical index and clears cached answers
+from answer_cache import FilesVersion, SemanticAnswerCache
+faq_data_version = FilesVersion(
+    [FAQ_SOURCE] + ([f"{FAQ_INDEX}.npy", f"{FAQ_INDEX}.json"] if FAQ_BACKEND == "numpy" else [FAQ_MILVUS_DB])
+)
+faq_lexical: Optional[LexicalFaqIndex] = None
+_faq_lexical_stamp = None
+
+def get_faq_lexical() -> LexicalFaqIndex:
+    global faq_lexical, _faq_lexical_stamp
+    stamp = faq_data_version.current()
+    if faq_lexical is None or stamp != _faq_lexical_stamp:
+        faq_lexical = LexicalFaqIndex.from_faqs_json(FAQ_SOURCE)
+        _faq_lexical_stamp = stamp
+    return faq_lexical
+
+# opt-in (ANSWER_CACHE=1): Roaming Agent answers to FAQ questions are reused for near-identical questions
+# (cosine >= ANSWER_CACHE_THRESHOLD between query embeddings) without running the agent turn
+answer_cache: Optional[SemanticAnswerCache] = None
+if os.environ.get("ANSWER_CACHE", "0") == "1":
+    answer_cache = SemanticAnswerCache(
+        faq_data_version,
+        threshold=float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.93)),
+        ttl_seconds=float(os.environ.get("ANSWER_CACHE_TTL", 3600)),
+        max_items=int(os.environ.get("ANSWER_CACHE_SIZE", 2000)),
+    )
+
+from embedding_cache import EmbeddingCache
+embedding_cache: Optional[EmbeddingCache] = None
+
+def get_embedding_cache() -> EmbeddingCache:
+    global embedding_cache
+    if embedding_cache is None:
+        embedding_cache = EmbeddingCache(os.environ.get("EMBED_CACHE_PATH", "embedding_cache.db"))
+    return embedding_cache
+
+# roaming catalog, indexed on first use and reloaded only when the json file changes
+from roaming_index import RoamingIndexLoader
+roaming_catalog = RoamingIndexLoader('roaming_locations.json')
 
 # records
-CONN = sqlite3.connect('roaming_plans.db')
+from plans_repository import PlansRepository
+plans_repo: Optional[PlansRepository] = None
+
+def get_plans_repo() -> PlansRepository:
+    global plans_repo
+    if plans_repo is None:
+        plans_repo = PlansRepository(os.environ.get("PLANS_DB", "roaming_plans.db"))
+    return plans_repo
+
+def warm_up() -> Dict[str, float]:
+    """Create and preload every resource (blocking); returns the seconds spent on each."""
+    timings: Dict[str, float] = {}
+    for name, load in (
+        ("openai_client", get_openai_client),
+        ("roaming_catalog", roaming_catalog.get),
+        ("plans_db", get_plans_repo),
+        ("embedding_cache", get_embedding_cache),
+        ("faq_index", lambda: get_faq_retriever().warm_up()),
+        ("faq_lexical", get_faq_lexical),
+        ("guardrail_classifiers", lambda: get_guardrail_classifiers()),
+    ):
+        start = time.perf_counter()
+        load()
+        timings[name] = time.perf_counter() - start
+    return timings
+
+def close_resources() -> None:
+    """Close whatever was opened; the accessors reopen on next use."""
+    global faq_retriever, embedding_cache, plans_repo
+    for resource in (faq_retriever, embedding_cache, plans_repo):
+        if resource is not None:
+            resource.close()
+    faq_retriever = embedding_cache = plans_repo = None
+    if guardrail_verdict_log is not None:
+        guardrail_verdict_log.close()
+
+# blocking I/O (milvus, sqlite) runs on a bounded thread pool so it never stalls the event loop
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("IO_THREADS", 8)), thread_name_prefix="tool-io")
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking call on IO_EXECUTOR and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(IO_EXECUTOR, functools.partial(fn, *args, **kwargs))
+
+# plan records are group-committed with other turns' records; record() returns once the row is committed
+from plan_writer import PlanWriteBehind
+plan_writes = PlanWriteBehind(
+    lambda rows: run_blocking(get_plans_repo().record_plans, rows),
+    flush_window=float(os.environ.get("PLAN_FLUSH_WINDOW_MS", 5)) / 1000,
+    max_batch=int(os.environ.get("PLAN_FLUSH_MAX_BATCH", 500)),
+    enabled=os.environ.get("PLAN_WRITE_BEHIND", "1") == "1",
+)
 
 # =========================
 # MODEL(S)
@@ -45,6 +203,36 @@ MODEL = "gpt-4.1-mini"
 GRMODEL = "gpt-4.1-nano"
 EMBEDMODEL = "text-embedding-3-small"
 
+def _base_model_provider():
+    if REPLAY:
+        set_tracing_disabled(True)
+        return CassetteModelProvider(CASSETTE, time_scale=CASSETTE_TIME_SCALE)
+    if STUB_PROVIDER:
+        from bench.stub_provider import StubModelProvider
+        set_tracing_disabled(True) # nothing to export traces to offline
+        provider = StubModelProvider.from_env()
+    else:
+        provider = MultiProvider()
+    return CassetteModelProvider(CASSETTE, inner=provider) if CASSETTE is not None else provider
+
+# one budget (concurrency, tokens/minute, bounded priority queue) for all outbound model and embedding calls
+call_scheduler = CallScheduler.from_env()
+
+# every Runner.run goes through this config, so all model calls are scheduled and timed
+RUN_CONFIG = RunConfig(model_provider=ScheduledModelProvider(TimedModelProvider(_base_model_provider()), call_scheduler))
+
+async def embed_query(text: str) -> List[float]:
+    """Embed a query with EMBEDMODEL, serving repeated questions from the embedding cache."""
+    with span("embedding_cache"):
+        vector = await run_blocking(get_embedding_cache().get, text, EMBEDMODEL)
+    if vector is None:
+        async with call_scheduler.slot(len(text) // 4 + 1):
+            with span("embedding", model=EMBEDMODEL):
+                response = await get_openai_client().embeddings.create(model=EMBEDMODEL,input=text,encoding_format="float")
+        vector = response.data[0].embedding
+        await run_blocking(get_embedding_cache().put, text, EMBEDMODEL, vector)
+    return vector
+
 # =========================
 # CONTEXT
 # =========================
@@ -69,7 +257,35 @@ def create_initial_context() -> TelcoAgentContext:
 # TOOLS
 # =========================
 
+# plan validation and recommendation, shared by the tools below and the back-office api (backoffice.py)
+def check_plan_name(plan: Optional[str]) -> str:
+    """Validate a plan name against the roaming catalog and return it as stored (e.g. `Asia`); raises ValueError."""
+    if plan is None or not plan.strip():
+        raise ValueError("roaming plan required")
+    catalog = roaming_catalog.get()
+    if not catalog.covers(plan.strip()):
+        raise ValueError("roaming plan must be one of: " + ", ".join(f"`{p.capitalize()}`" for p in catalog.plans))
+    return plan.strip().capitalize()
+
+def require_customer(context: TelcoAgentContext) -> None:
+    """Plan records need the customer's name and phone number (collected by get_customer_information_tool)."""
+    if not context.customer_name or not context.phone_number:
+        raise ValueError("customer name and phone number are required; ask the customer for them first")
+
+def recommend_plan(destinations: Iterable[str]) -> Optional[str]:
+    """Lowest-ranked plan covering every destination, or None if no plan does; raises ValueError for local usage."""
+    q = set([d.strip().lower() for d in destinations])
+
+    ## check if Singapore (local) is part of the destinations - throw exception
+    for loc in q:
+        if loc == 'singapore':
+            raise ValueError("Roaming is not applicable for local Singapore usage.")
+
+    # lowest-ranked plan covering all destinations, from the preloaded catalog index
+    return roaming_catalog.get().lookup(q)
+
 @function_tool
+@traced_tool
 async def get_customer_information_tool(
     context: RunContextWrapper[TelcoAgentContext],
     customer_name:str,
@@ -78,120 +294,115 @@ async def get_customer_information_tool(
     """
     Tool to update customer's name and phone number. Should only be used once.
     """
-    context.context.customer_name = customer_name
-    context.context.phone_number = phone_number
+    if not customer_name.strip() or not phone_number.strip():
+        raise ValueError("customer name and phone number are required")
 
     ## find previous record
-    cursor = CONN.cursor()
-    cmd = f"SELECT roaming_plan FROM plans where customer_name=='{customer_name}' and phone_number=='{phone_number}'"
-    cursor.execute(cmd)
-    retplans = cursor.fetchall()
-    if len(retplans) > 0:
+    with span("sqlite", op="latest_plan"):
+        record = await run_blocking(get_plans_repo().latest_plan, phone_number, customer_name)
+    if record is None:
+        # if not exists, create new record (the context only changes once it is committed)
+        await plan_writes.record(customer_name, phone_number, context.context.roaming_plan)
+
+    context.context.customer_name = customer_name
+    context.context.phone_number = phone_number
+    if record is not None:
         # if record exists
-        context.context.roaming_plan = retplans[-1][0] # get the last plan that was purchased (assume no expiry)
-    else:
-        # if not exists, create new record
-        cmd = f"INSERT INTO plans (customer_name, phone_number, roaming_plan) \
-            VALUES ('{customer_name}', '{phone_number}', '{context.context.roaming_plan}')"
-        cursor.execute(cmd)
-        CONN.commit()
-    # CONN.close()
+        context.context.roaming_plan = record.roaming_plan # the last plan that was purchased (assume no expiry)
 
     
 @function_tool
+@traced_tool
 async def roaming_plans_lookup_tool(destinations: List[str]) -> str:
     """
     Lookup roaming plans based on intended destination(s).
     """
     #q = set([q.strip() for q in question.lower().split(',')]) # assume input string is only of locations, split by commas
-    q = set([d.lower() for d in destinations])
-
-    ## check if Singapore (local) is part of the destinations - throw exception
-    for loc in q:
-        assert loc != 'singapore', "Roaming is not applicable for local Singapore usage."
-
-    # load roaming locations
-    with open('roaming_locations.json','r') as f:
-        roaming = json.load(f)
-
-    # set roaming rank (to find most appropriate roaming coverage)
-    roaming_rank = {'neighbours':0,'asia':1,'worldwide':2,'others':3}
-
-    max_intersect = -1
-    max_set = []
-    for k in roaming.keys():
-        sz = len(q.intersection(roaming[k])) # size of intersection
-        if sz > max_intersect:
-            max_intersect = sz
-            max_set = []
-            max_set.append(k)
-        elif sz == max_intersect:
-            max_set.append(k)
-    
-    if max_intersect < len(q):
+    plan = recommend_plan(destinations)
+    if plan is None:
         return 'Unforunately, we are unable to provide ReadyRoam coverage for all your destinations.'
     else:
-        td = {m:roaming_rank[m] for m in max_set}
-        return f'ReadyRoam {min(td, key=td.get).capitalize()} would be suitable for your trip.'
+        return f'ReadyRoam {plan.capitalize()} would be suitable for your trip.'
+
+# FAQ retrieval: FAQ_TOP_K hits are returned; a lexical match at least FAQ_LEXICAL_SKIP (near-identical
+# question) is answered without embedding the query; below FAQ_MIN_SCORE the tool reports no confident match
+FAQ_TOP_K = int(os.environ.get("FAQ_TOP_K", 3))
+FAQ_MIN_SCORE = float(os.environ.get("FAQ_MIN_SCORE", 0.45))
+FAQ_LEXICAL_SKIP = float(os.environ.get("FAQ_LEXICAL_SKIP", 0.85))
+FAQ_VECTOR_WEIGHT = float(os.environ.get("FAQ_VECTOR_WEIGHT", 0.7))
+faq_route_counts: Counter = Counter() # "lexical" (embedding skipped) / "hybrid"
+
+def format_faq_hits(hits: List[Dict], min_score: float) -> str:
+    """Render FAQ hits for the agent, best first, flagging when none is a confident match."""
+    if not hits or hits[0]["score"] < min_score:
+        header = f"No confident FAQ match (best score below {min_score}). Do not answer from these; say you are not sure."
+    else:
+        header = f"FAQ matches, best first (score 0-1; ignore matches below {min_score}):"
+    lines = [header]
+    for rank, hit in enumerate(hits, 1):
+        lines.append(f"{rank}. [score {hit['score']:.2f}] Q: {hit['question']}\n   A: {hit['answer']}")
+    return "\n".join(lines)
 
 @function_tool
+@traced_tool
 async def roaming_faq_lookup_tool(question: str) -> str:
-    """Lookup FAQs for roaming."""
+    """Lookup FAQs for roaming. Returns the closest FAQ entries with match scores (0-1)."""
     print('<performing RAG>')
+    lexical_index = get_faq_lexical()
+    with span("faq_search", backend="lexical"):
+        lexical_hits = lexical_index.search(question, FAQ_TOP_K * 2)
+    if lexical_hits and max(h["lexical"] for h in lexical_hits) >= FAQ_LEXICAL_SKIP:
+        faq_route_counts["lexical"] += 1 # near-exact question match: no embedding round trip
+        hits = lexical_index.fuse(question, lexical_hits, None, FAQ_TOP_K)
+        return format_faq_hits(hits, FAQ_MIN_SCORE)
+
     print('encoding query...')
-    encode_doc = lambda doc : openai_client.embeddings.create(model=EMBEDMODEL,input=doc,encoding_format="float").data[0].embedding
-    
+    query_vector = await embed_query(question)
+
     # perform vector search
     print('retrieving answers...')
-    search_res = milvus_client.search(
-                    collection_name='faq',
-                    data=[
-                        encode_doc(question)
-                    ],  
-                    limit=1,  # Return top result
-                    search_params={"metric_type": "COSINE", "params": {}},  # Cosine distance
-                    output_fields=["id","question","answer"],  # Return the text field
-                )
-    
-    return search_res[0][0]["entity"]['answer'] #"ROAMING FAQS"
+    with span("faq_search", backend=FAQ_BACKEND):
+        retriever = get_faq_retriever()
+        if retriever.blocking:
+            vector_hits = await run_blocking(retriever.search, query_vector, FAQ_TOP_K * 2)
+        else:
+            vector_hits = retriever.search(query_vector, FAQ_TOP_K * 2)
+    faq_route_counts["hybrid"] += 1
+    hits = lexical_index.fuse(question, lexical_hits, vector_hits, FAQ_TOP_K, FAQ_VECTOR_WEIGHT)
+    return format_faq_hits(hits, FAQ_MIN_SCORE)
 
 @function_tool
+@traced_tool
 async def purchase_roaming_tool(
     context: RunContextWrapper[TelcoAgentContext], 
     new_roaming_plan: str
 ) -> str:
     """Update new roaming plan for an associated phone number."""
-    assert new_roaming_plan is not None, "roaming plan required"
-    assert new_roaming_plan.lower() in ['neighbours','asia','worldwide','others'], "roaming plan must be one of: `Neighbours`, `Asia`, `Worldwide`,`Others` "
-    
-    context.context.roaming_plan = new_roaming_plan
+    new_roaming_plan = check_plan_name(new_roaming_plan)
+    require_customer(context.context)
+
+    ## update db (group-committed; raises if the write fails, leaving the context unchanged)
+    await plan_writes.record(context.context.customer_name, context.context.phone_number, new_roaming_plan)
 
-    ## update db
-    cursor = CONN.cursor()
-    cmd = f"INSERT INTO plans (customer_name, phone_number, roaming_plan) \
-    VALUES ('{context.context.customer_name}', '{context.context.phone_number}', '{new_roaming_plan}')"
-    cursor.execute(cmd)
-    CONN.commit()
-    # CONN.close()
+    context.context.roaming_plan = new_roaming_plan
     
     return f"Updated roaming plan to {new_roaming_plan} for {context.context.phone_number}"
 
 
 @function_tool
+@traced_tool
 async def roaming_cancellation_tool(
     context: RunContextWrapper[TelcoAgentContext]
 ) -> str:
     """Remove roaming plan for an associated phone number."""
-    assert context.context.roaming_plan is not None, "no roaming plan existing"
-    context.context.roaming_plan = None
+    if context.context.roaming_plan is None:
+        raise ValueError("no roaming plan existing")
+    require_customer(context.context)
 
-    ## update db
-    cursor = CONN.cursor()
-    cmd = f"INSERT INTO plans (customer_name, phone_number, roaming_plan) \
-    VALUES ('{context.context.customer_name}', '{context.context.phone_number}', '{None}')"
-    cursor.execute(cmd)
-    CONN.commit()
-    # CONN.close()
+    ## update db (group-committed; raises if the write fails, leaving the context unchanged)
+    await plan_writes.record(context.context.customer_name, context.context.phone_number, None)
+
+    context.context.roaming_plan = None
     
     return f"Removed roaming plan for {context.context.phone_number}"
 
@@ -199,6 +410,83 @@ async def roaming_cancellation_tool(
 # GUARDRAILS
 # =========================
 
+from guardrail_fastpath import VerdictCache, decision_counts, rule_verdict
+from guardrail_classifier import GuardrailClassifier, VerdictLog, load_classifiers
+
+class GuardrailVerdict(BaseModel):
+    """A guardrail decision, and which stage made it ("rule", "cache", "classifier" or "llm").
+    Turns answered from the answer cache report "answer_cache" instead (see api.py)."""
+    reasoning: str
+    passed: bool
+    decided_by: str = "llm"
+
+# LLM verdicts keyed by normalized message text, shared by all conversations in the worker
+guardrail_verdict_cache = VerdictCache(
+    max_items=int(os.environ.get("GUARDRAIL_CACHE_SIZE", 5000)),
+    ttl_seconds=float(os.environ.get("GUARDRAIL_CACHE_TTL", 3600)),
+)
+
+# local classifiers (utils/train_guardrail_classifier.py) decide confident cases without the LLM;
+# guardrails without a model file in GUARDRAIL_MODEL_DIR always escalate
+GUARDRAIL_MODEL_DIR = os.environ.get("GUARDRAIL_MODEL_DIR", "guardrail_models")
+GUARDRAIL_MODEL_FILES = {"Relevance Guardrail": "relevance", "Jailbreak Guardrail": "jailbreak"}
+guardrail_classifiers: Optional[Dict[str, GuardrailClassifier]] = None
+
+def get_guardrail_classifiers() -> Dict[str, GuardrailClassifier]:
+    global guardrail_classifiers
+    if guardrail_classifiers is None:
+        guardrail_classifiers = load_classifiers(GUARDRAIL_MODEL_DIR, GUARDRAIL_MODEL_FILES)
+    return guardrail_classifiers
+
+# (guardrail name, "decided" | "escalated") -> count, for turns that reached the classifier
+classifier_counts: Counter = Counter()
+
+# GUARDRAIL_VERDICT_LOG=<path>: every LLM verdict is appended there as training data for the classifiers
+guardrail_verdict_log = VerdictLog(os.environ["GUARDRAIL_VERDICT_LOG"]) if os.environ.get("GUARDRAIL_VERDICT_LOG") else None
+
+# per-turn hook, called with (guardrail name, verdict) as soon as each input guardrail has decided;
+# api.py sets it for /chat/stream so guardrail frames go out while the run is still going
+guardrail_listener: ContextVar[Optional[Callable[[str, GuardrailVerdict], None]]] = ContextVar("guardrail_listener", default=None)
+
+def _classifier_verdict(name: str, text: str) -> Optional[GuardrailVerdict]:
+    """The local classifier's verdict if it is confident, else None (escalate to the LLM)."""
+    classifier = get_guardrail_classifiers().get(name)
+    if classifier is None:
+        return None
+    passed = classifier.decide(text)
+    classifier_counts[(name, "escalated" if passed is None else "decided")] += 1
+    if passed is None:
+        return None
+    return GuardrailVerdict(reasoning="Confident local classifier verdict.", passed=passed, decided_by="classifier")
+
+async def _run_guardrail(name: str, input: str | list[TResponseInputItem], llm_check) -> GuardrailFunctionOutput:
+    """
+    Decide a guardrail cheaply where possible: local rules for trivially safe messages,
+    then the verdict cache, then the local classifier when it is confident,
+    and only then the LLM check (whose verdict is cached and logged).
+    """
+    text = latest_user_text(input)
+    reason = rule_verdict(text, roaming_catalog.get().masks)
+    if reason is not None:
+        verdict = GuardrailVerdict(reasoning=reason, passed=True, decided_by="rule")
+    else:
+        cached = guardrail_verdict_cache.get(name, text)
+        if cached is not None:
+            verdict = cached.model_copy(update={"decided_by": "cache"})
+        elif (local := _classifier_verdict(name, text)) is not None:
+            verdict = local
+        else:
+            with span("guardrail", guardrail=name):
+                verdict = await llm_check()
+            guardrail_verdict_cache.put(name, text, verdict)
+            if guardrail_verdict_log is not None: # file i/o, off the event loop
+                await run_blocking(guardrail_verdict_log.append, name, text, verdict.passed, verdict.reasoning)
+    decision_counts[(name, verdict.decided_by)] += 1
+    listener = guardrail_listener.get()
+    if listener is not None:
+        listener(name, verdict)
+    return GuardrailFunctionOutput(output_info=verdict, tripwire_triggered=not verdict.passed)
+
 
 ### Relevance guardrail
 class RelevanceOutput(BaseModel):
@@ -225,9 +513,14 @@ async def relevance_guardrail(
     context: RunContextWrapper[None], agent: Agent, input: str | list[TResponseInputItem]
 ) -> GuardrailFunctionOutput:
     """Guardrail to check if input is relevant to telco topics."""
-    result = await Runner.run(guardrail_agent, input, context=context.context)
-    final = result.final_output_as(RelevanceOutput)
-    return GuardrailFunctionOutput(output_info=final, tripwire_triggered=not final.is_relevant)
+    async def llm_check() -> GuardrailVerdict:
+        if COMBINED_GUARDRAILS:
+            verdict = await _combined_verdict(context, input)
+            return GuardrailVerdict(reasoning=verdict.relevance_reasoning, passed=verdict.is_relevant)
+        result = await Runner.run(guardrail_agent, input, context=context.context, run_config=RUN_CONFIG)
+        final = result.final_output_as(RelevanceOutput)
+        return GuardrailVerdict(reasoning=final.reasoning, passed=final.is_relevant)
+    return await _run_guardrail("Relevance Guardrail", input, llm_check)
 
 
 ### Jailbreak guardrail
@@ -257,9 +550,68 @@ async def jailbreak_guardrail(
     context: RunContextWrapper[None], agent: Agent, input: str | list[TResponseInputItem]
 ) -> GuardrailFunctionOutput:
     """Guardrail to detect jailbreak attempts."""
-    result = await Runner.run(jailbreak_guardrail_agent, input, context=context.context)
-    final = result.final_output_as(JailbreakOutput)
-    return GuardrailFunctionOutput(output_info=final, tripwire_triggered=not final.is_safe)
+    async def llm_check() -> GuardrailVerdict:
+        if COMBINED_GUARDRAILS:
+            verdict = await _combined_verdict(context, input)
+            return GuardrailVerdict(reasoning=verdict.safety_reasoning, passed=verdict.is_safe)
+        result = await Runner.run(jailbreak_guardrail_agent, input, context=context.context, run_config=RUN_CONFIG)
+        final = result.final_output_as(JailbreakOutput)
+        return GuardrailVerdict(reasoning=final.reasoning, passed=final.is_safe)
+    return await _run_guardrail("Jailbreak Guardrail", input, llm_check)
+
+
+### Combined guardrail (optional)
+# With COMBINED_GUARDRAILS=1, the relevance and jailbreak guardrails share a single structured-output
+# call per turn. Both guardrails stay attached to each agent, so they are still reported as two checks.
+COMBINED_GUARDRAILS = os.environ.get("COMBINED_GUARDRAILS", "0") == "1"
+
+class CombinedGuardrailOutput(BaseModel):
+    """Schema for the combined relevance + jailbreak decision."""
+    relevance_reasoning: str
+    is_relevant: bool
+    safety_reasoning: str
+    is_safe: bool
+
+combined_guardrail_agent = Agent(
+    name="Combined Guardrail",
+    model=GRMODEL,
+    instructions=(
+        "You perform two independent checks on the user's message.\n"
+        f"Relevance check: {guardrail_agent.instructions}\n"
+        f"Safety check: {jailbreak_guardrail_agent.instructions}\n"
+        "Fill in relevance_reasoning/is_relevant for the relevance check and safety_reasoning/is_safe for the safety check."
+    ),
+    output_type=CombinedGuardrailOutput,
+)
+
+def latest_user_text(input: str | list[TResponseInputItem]) -> str:
+    """Text of the most recent user message in a guardrail input."""
+    if isinstance(input, str):
+        return input
+    for item in reversed(input):
+        if isinstance(item, dict) and item.get("role") == "user":
+            content = item.get("content")
+            if isinstance(content, list):
+                return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+            return str(content)
+    return ""
+
+# in-flight combined calls, so the two guardrails of one run await the same request
+_combined_inflight: dict[tuple, asyncio.Task] = {}
+
+async def _combined_verdict(
+    context: RunContextWrapper[None], input: str | list[TResponseInputItem]
+) -> CombinedGuardrailOutput:
+    key = (id(context.context), len(input), latest_user_text(input))
+    task = _combined_inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(Runner.run(combined_guardrail_agent, input, context=context.context, run_config=RUN_CONFIG))
+        _combined_inflight[key] = task
+        # keep the entry briefly after completion in case the sibling guardrail starts late
+        task.add_done_callback(lambda _: asyncio.get_running_loop().call_later(5, _combined_inflight.pop, key, None))
+    # shield: if one guardrail trips and the sdk cancels its sibling, the shared call keeps running
+    result = await asyncio.shield(task)
+    return result.final_output_as(CombinedGuardrailOutput)
 
 # =========================
 # AGENTS
@@ -280,7 +632,9 @@ def roaming_agent_instructions(
         "If this is not available, ask the customer for their phone  number. If you have it, confirm that is the phone number they are referencing.\n"
         "2. Determine if the customer requires a recommendation for a roaming plan, or has questions about roaming plans"
         "3. If they require a recommendation, identify a list of destinations they want to travel to. Use the roaming_plans_lookup_tool to suggest the appropriate roaming plan that suits the customer's destinations.\n"
-        "4. If they have questions, answer them using the roaming_faq_lookup_tool. Do not rely on your own knowledge.\n"
+        "4. If they have questions, answer them using the roaming_faq_lookup_tool. Do not rely on your own knowledge. "
+        "The tool returns the closest FAQ entries with match scores; answer only from entries that actually address the question. "
+        "If it reports no confident match, tell the customer you could not find that in the roaming FAQs and suggest contacting Singtel.\n"
         "If the customer asks a question that is not related to the routine, transfer back to the customer service agent."
     )
 
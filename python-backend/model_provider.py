@@ -0,0 +1,77 @@
+import json
+from typing import Any, AsyncIterator
+
+from agents.models.interface import Model, ModelProvider
+
+from scheduler import CallScheduler
+from telemetry import span
+
+# =========================
+# Model provider wrappers
+# =========================
+
+class TimedModel(Model):
+    """Wraps a model so every request is recorded as a "model" span."""
+
+    def __init__(self, inner: Model, model_name: str):
+        self.inner = inner
+        self.model_name = model_name
+
+    async def get_response(self, *args: Any, **kwargs: Any):
+        with span("model", model=self.model_name):
+            return await self.inner.get_response(*args, **kwargs)
+
+    async def stream_response(self, *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        with span("model", model=self.model_name):
+            async for event in self.inner.stream_response(*args, **kwargs):
+                yield event
+
+
+class TimedModelProvider(ModelProvider):
+    """Model provider that times every model call made through it."""
+
+    def __init__(self, inner: ModelProvider):
+        self.inner = inner
+
+    def get_model(self, model_name: str | None) -> Model:
+        return TimedModel(self.inner.get_model(model_name), model_name or "default")
+
+
+OUTPUT_TOKEN_ALLOWANCE = 256 # reserved per call for the completion; corrected from usage afterwards
+
+def estimate_call_tokens(system_instructions: Any, input: Any) -> int:
+    """Cheap (~4 chars/token) estimate of a model call's tokens, for budgeting before the call."""
+    text = input if isinstance(input, str) else json.dumps(input, default=str)
+    return (len(system_instructions or "") + len(text)) // 4 + OUTPUT_TOKEN_ALLOWANCE
+
+
+class ScheduledModel(Model):
+    """Wraps a model so every request first takes a slot from the CallScheduler."""
+
+    def __init__(self, inner: Model, scheduler: CallScheduler):
+        self.inner = inner
+        self.scheduler = scheduler
+
+    async def get_response(self, system_instructions, input, *args: Any, **kwargs: Any):
+        async with self.scheduler.slot(estimate_call_tokens(system_instructions, input)) as usage:
+            response = await self.inner.get_response(system_instructions, input, *args, **kwargs)
+            usage["tokens"] = getattr(response.usage, "total_tokens", None) or None
+            return response
+
+    async def stream_response(self, system_instructions, input, *args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        async with self.scheduler.slot(estimate_call_tokens(system_instructions, input)) as usage:
+            async for event in self.inner.stream_response(system_instructions, input, *args, **kwargs):
+                if getattr(event, "type", None) == "response.completed":
+                    usage["tokens"] = getattr(getattr(event.response, "usage", None), "total_tokens", None)
+                yield event
+
+
+class ScheduledModelProvider(ModelProvider):
+    """Model provider that admits every model call through a shared CallScheduler."""
+
+    def __init__(self, inner: ModelProvider, scheduler: CallScheduler):
+        self.inner = inner
+        self.scheduler = scheduler
+
+    def get_model(self, model_name: str | None) -> Model:
+        return ScheduledModel(self.inner.get_model(model_name), self.scheduler)
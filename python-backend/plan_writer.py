@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telemetry import histogram
+
+logger = logging.getLogger(__name__)
+
+# =========================
+# Write-behind queue for plan records
+# =========================
+# Tools queue their `plans` rows instead of each committing its own transaction. A background task
+# collects rows for `flush_window` seconds (or until `max_batch` rows) and writes each batch in one
+# transaction, so concurrent turns share commits. record() returns only once its row is committed and
+# raises if the batch failed: a tool reports success to the model (and updates the conversation
+# context) only for changes that are in the database, and a failed write reaches the model as a tool error.
+
+PlanRow = Tuple[str, str, Optional[str]] # (customer_name, phone_number, roaming_plan or None)
+
+flush_seconds = histogram("telco_plan_flush_seconds", "Time to write one batch of plan records.")
+write_latency = histogram("telco_plan_write_latency_seconds", "Time from queueing a plan record until it is committed.")
+batch_sizes = histogram(
+    "telco_plan_flush_batch_size", "Plan records written per transaction.", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500)
+)
+
+
+class PlanWriteBehind:
+    """Queue of `plans` rows, group-committed by a background task through `write_batch`."""
+
+    def __init__(
+        self,
+        write_batch: Callable[[List[PlanRow]], Awaitable[None]],
+        flush_window: float = 0.005,
+        max_batch: int = 500,
+        enabled: bool = True,
+    ):
+        self.write_batch = write_batch
+        self.flush_window = flush_window
+        self.max_batch = max_batch
+        self.enabled = enabled # False: every record() is written in its own transaction, without the queue
+        self._pending: List[Tuple[PlanRow, asyncio.Future, float]] = [] # (row, future, queued at)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.flushes = 0
+        self.records = 0
+        self.failures = 0
+
+    def _ensure_task(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def record(self, customer_name: str, phone_number: str, roaming_plan: Optional[str]) -> None:
+        """Write a plan change (None records a cancellation / no plan); returns once it is committed."""
+        row = (customer_name, phone_number, roaming_plan)
+        if not self.enabled:
+            await self._flush([(row, None, time.monotonic())])
+            return
+        self._ensure_task()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((row, future, time.monotonic()))
+        self._wakeup.set()
+        await asyncio.shield(future) # a cancelled tool call does not pull its row from the batch
+
+    async def _run(self) -> None:
+        while self._pending or not self._closing:
+            if not self._pending:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            if not self._closing and len(self._pending) < self.max_batch and self.flush_window > 0:
+                await asyncio.sleep(self.flush_window) # group commit: let concurrent turns join the batch
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[PlanRow, Optional[asyncio.Future], float]]) -> None:
+        """Write one batch; queued rows get the outcome through their future, an unqueued row (future None) raises."""
+        start = time.monotonic()
+        try:
+            await self.write_batch([row for row, _, _ in batch])
+        except Exception as e:
+            logger.exception(f"failed to write {len(batch)} plan records")
+            self.failures += len(batch)
+            for _, future, _ in batch:
+                if future is None:
+                    raise
+                if not future.done():
+                    future.set_exception(e)
+                    future.exception() # already logged above; don't warn again if the tool call was cancelled
+            return
+        now = time.monotonic()
+        flush_seconds.observe(now - start)
+        batch_sizes.observe(len(batch))
+        for _, future, queued_at in batch:
+            write_latency.observe(now - queued_at)
+            if future is not None and not future.done():
+                future.set_result(None)
+        self.flushes += 1
+        self.records += len(batch)
+
+    async def close(self) -> None:
+        """Flush everything still queued and stop the background task (it restarts on the next record)."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await self._task
+        finally:
+            self._task = None
+            self._closing = False
+
+    def stats(self) -> Dict[str, float]:
+        return {"queued": len(self._pending), "flushes": self.flushes, "records": self.records, "failures": self.failures}
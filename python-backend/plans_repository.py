@@ -0,0 +1,262 @@
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+# =========================
+# Plans repository
+# =========================
+
+CREATE_PLANS_SQL = """
+CREATE TABLE IF NOT EXISTS plans (
+    customer_name TEXT NOT NULL,
+    phone_number TEXT NOT NULL,
+    roaming_plan TEXT, -- NULL: no plan / cancelled (rows written before schema v1 used the string 'None')
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+"""
+# history lookups per customer (and compaction) seek by (phone_number, customer_name, timestamp)
+CREATE_PLANS_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_plans_phone_name_ts ON plans (phone_number, customer_name, timestamp)
+"""
+# one row per customer holding their latest plan, maintained by a trigger on every insert into `plans`;
+# lookups read this table, so they stay O(1) however long the history grows
+CREATE_CURRENT_PLANS_SQL = """
+CREATE TABLE IF NOT EXISTS current_plans (
+    phone_number TEXT NOT NULL,
+    customer_name TEXT NOT NULL,
+    roaming_plan TEXT,
+    timestamp DATETIME NOT NULL,
+    PRIMARY KEY (phone_number, customer_name)
+) WITHOUT ROWID
+"""
+CREATE_CURRENT_PLANS_TRIGGER_SQL = """
+CREATE TRIGGER IF NOT EXISTS trg_plans_current AFTER INSERT ON plans
+BEGIN
+    INSERT INTO current_plans (phone_number, customer_name, roaming_plan, timestamp)
+    VALUES (NEW.phone_number, NEW.customer_name, NULLIF(NEW.roaming_plan, 'None'), NEW.timestamp)
+    ON CONFLICT (phone_number, customer_name) DO UPDATE
+    SET roaming_plan = excluded.roaming_plan, timestamp = excluded.timestamp
+    WHERE excluded.timestamp >= current_plans.timestamp;
+END
+"""
+# backfill for db files created before current_plans existed: the newest history row per customer
+BACKFILL_CURRENT_PLANS_SQL = """
+INSERT OR REPLACE INTO current_plans (phone_number, customer_name, roaming_plan, timestamp)
+SELECT p.phone_number, p.customer_name, NULLIF(p.roaming_plan, 'None'), p.timestamp FROM plans p
+WHERE p.rowid = (
+    SELECT rowid FROM plans WHERE phone_number = p.phone_number AND customer_name = p.customer_name
+    ORDER BY timestamp DESC, rowid DESC LIMIT 1
+)
+"""
+
+# schema versions, tracked in PRAGMA user_version; each step upgrades a db file from the previous version
+SCHEMA_VERSION = 1
+MIGRATIONS = {
+    1: [ # plans history + current_plans; cancellations stored as NULL
+        CREATE_PLANS_SQL,
+        CREATE_PLANS_INDEX_SQL,
+        "UPDATE plans SET roaming_plan = NULL WHERE roaming_plan = 'None'",
+        CREATE_CURRENT_PLANS_SQL,
+        BACKFILL_CURRENT_PLANS_SQL,
+        CREATE_CURRENT_PLANS_TRIGGER_SQL,
+    ],
+}
+
+LATEST_PLAN_SQL = """
+SELECT customer_name, phone_number, roaming_plan, timestamp FROM current_plans
+WHERE phone_number = ? AND customer_name = ?
+"""
+INSERT_PLAN_SQL = "INSERT INTO plans (customer_name, phone_number, roaming_plan) VALUES (?, ?, ?)"
+
+# current plan for each of a batch of (phone_number, customer_name or NULL = latest customer on the number) keys
+LATEST_PLANS_SQL = """
+WITH keys(idx, phone_number, customer_name) AS (VALUES {values})
+SELECT k.idx, p.customer_name, p.phone_number, p.roaming_plan, p.timestamp
+FROM keys k LEFT JOIN current_plans p ON p.phone_number = k.phone_number AND p.customer_name = COALESCE(
+    k.customer_name,
+    (SELECT customer_name FROM current_plans WHERE phone_number = k.phone_number ORDER BY timestamp DESC LIMIT 1)
+)
+"""
+MAX_BATCH_KEYS = 1000 # 3 bound parameters per key stays well under sqlite's variable limit
+
+
+class PlanRecord(NamedTuple):
+    customer_name: str
+    phone_number: str
+    roaming_plan: Optional[str]
+    timestamp: str
+
+
+def configure_connection(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Apply the pragmas every plans connection uses."""
+    conn.execute("PRAGMA journal_mode=WAL") # readers never block the writer (and vice versa)
+    conn.execute("PRAGMA synchronous=NORMAL") # fsync at checkpoints rather than on every commit; safe under WAL
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """Create the plans schema, or migrate an existing db file up to SCHEMA_VERSION."""
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return
+    conn.execute("BEGIN IMMEDIATE") # one migrator at a time when several workers start together
+    try:
+        version = schema_version(conn)
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            for statement in MIGRATIONS[target]:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {target}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+# =========================
+# History compaction
+# =========================
+# Old `plans` rows are moved into one archive table per month (plans_archive_YYYY_MM); current_plans
+# is not touched, so lookups are unaffected. The plans_history view unions the archives and `plans`.
+
+ARCHIVE_PREFIX = "plans_archive_"
+
+def archive_table(month: str) -> str:
+    """Archive partition for a 'YYYY-MM' month."""
+    year, mon = month.split("-")
+    return f"{ARCHIVE_PREFIX}{int(year):04d}_{int(mon):02d}"
+
+def _next_month(month: str) -> str:
+    year, mon = (int(part) for part in month.split("-"))
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+def create_history_view(conn: sqlite3.Connection) -> None:
+    """(Re)create plans_history over every archive partition plus the live `plans` table."""
+    tables = [name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name", (f"{ARCHIVE_PREFIX}*",)
+    )]
+    selects = [f"SELECT customer_name, phone_number, roaming_plan, timestamp FROM {table}" for table in tables + ["plans"]]
+    with conn:
+        conn.execute("DROP VIEW IF EXISTS plans_history")
+        conn.execute("CREATE VIEW plans_history AS " + " UNION ALL ".join(selects))
+
+def compact_history(conn: sqlite3.Connection, before: str, batch_rows: int = 10000, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Move `plans` rows with timestamp < `before` into their monthly archive tables, `batch_rows` rows
+    per transaction so live writers are never blocked for long. Returns rows moved (or, in a dry run,
+    rows that would move) per month.
+    """
+    months = [month for (month,) in conn.execute(
+        "SELECT DISTINCT substr(timestamp, 1, 7) FROM plans WHERE timestamp < ? ORDER BY 1", (before,)
+    )]
+    moved: Dict[str, int] = {}
+    for month in months:
+        window = (f"{month}-01", min(before, f"{_next_month(month)}-01"))
+        if dry_run:
+            moved[month] = conn.execute("SELECT COUNT(*) FROM plans WHERE timestamp >= ? AND timestamp < ?", window).fetchone()[0]
+            continue
+        table = archive_table(month)
+        with conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                "(customer_name TEXT NOT NULL, phone_number TEXT NOT NULL, roaming_plan TEXT, timestamp DATETIME)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_phone_ts ON {table} (phone_number, timestamp)")
+        moved[month] = 0
+        while True:
+            rowids = [r for (r,) in conn.execute(
+                "SELECT rowid FROM plans WHERE timestamp >= ? AND timestamp < ? LIMIT ?", (*window, batch_rows)
+            )]
+            if not rowids:
+                break
+            batch = json.dumps(rowids)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    f"INSERT INTO {table} (customer_name, phone_number, roaming_plan, timestamp) "
+                    "SELECT customer_name, phone_number, roaming_plan, timestamp FROM plans "
+                    "WHERE rowid IN (SELECT value FROM json_each(?))", (batch,)
+                )
+                conn.execute("DELETE FROM plans WHERE rowid IN (SELECT value FROM json_each(?))", (batch,))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            moved[month] += len(rowids)
+    if not dry_run and months:
+        create_history_view(conn)
+    return moved
+
+
+class PlansRepository:
+    """
+    Data access for the plans history (`plans`, append-only) and the current plan per customer (`current_plans`).
+    One writer connection (sqlite allows a single writer at a time) plus a small pool of
+    reader connections; all statements are parameterized and cached per connection.
+    Methods are blocking and are meant to be called through main.run_blocking.
+    """
+
+    def __init__(self, path: str = "roaming_plans.db", readers: int = 4):
+        self.path = path
+        self._writer = self._connect()
+        self._write_lock = threading.Lock()
+        ensure_schema(self._writer)
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        for _ in range(readers):
+            self._readers.put(self._connect())
+
+    def _connect(self) -> sqlite3.Connection:
+        return configure_connection(sqlite3.connect(self.path, check_same_thread=False, cached_statements=64))
+
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    @staticmethod
+    def _to_record(row) -> PlanRecord:
+        customer_name, phone_number, roaming_plan, timestamp = row
+        return PlanRecord(customer_name, phone_number, roaming_plan, timestamp)
+
+    def latest_plan(self, phone_number: str, customer_name: str) -> Optional[PlanRecord]:
+        """Current plan record for a customer, or None if they have no history."""
+        with self._reader() as conn:
+            row = conn.execute(LATEST_PLAN_SQL, (phone_number, customer_name)).fetchone()
+        return self._to_record(row) if row else None
+
+    def latest_plans(self, keys: Sequence[Tuple[str, Optional[str]]]) -> List[Optional[PlanRecord]]:
+        """latest_plan() for many (phone_number, customer_name) keys; a None name matches any customer."""
+        results: List[Optional[PlanRecord]] = [None] * len(keys)
+        with self._reader() as conn:
+            for start in range(0, len(keys), MAX_BATCH_KEYS):
+                chunk = keys[start:start + MAX_BATCH_KEYS]
+                sql = LATEST_PLANS_SQL.format(values=", ".join(["(?, ?, ?)"] * len(chunk)))
+                params = [v for i, (phone, name) in enumerate(chunk, start) for v in (i, phone, name)]
+                for idx, *row in conn.execute(sql, params):
+                    if row[1] is not None:
+                        results[idx] = self._to_record(row)
+        return results
+
+    def record_plan(self, customer_name: str, phone_number: str, roaming_plan: Optional[str]) -> None:
+        """Append a plan change (None records a cancellation / no plan)."""
+        with self._write_lock, self._writer:
+            self._writer.execute(INSERT_PLAN_SQL, (customer_name, phone_number, roaming_plan))
+
+    def record_plans(self, rows: Iterable[Tuple[str, str, Optional[str]]]) -> None:
+        """Append a batch of (customer_name, phone_number, roaming_plan) rows in one transaction."""
+        with self._write_lock, self._writer:
+            self._writer.executemany(INSERT_PLAN_SQL, rows)
+
+    def close(self) -> None:
+        self._writer.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
@@ -0,0 +1,75 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Iterable, Mapping, Optional, Tuple
+
+# =========================
+# Roaming catalog index
+# =========================
+
+# roaming rank (to find most appropriate roaming coverage); lower is smaller/cheaper
+ROAMING_RANK = {'neighbours': 0, 'asia': 1, 'worldwide': 2, 'others': 3}
+
+
+@dataclass(frozen=True)
+class RoamingIndex:
+    """
+    Immutable inverted index over the roaming catalog.
+    Plans are ordered by rank, and each destination (including aliases like "hk") maps
+    to a bitmask of the plans covering it, so bit i set means plans[i] covers it.
+    """
+    plans: Tuple[str, ...]
+    masks: Mapping[str, int]
+    mtime: float
+
+    @classmethod
+    def from_catalog(cls, roaming: Mapping[str, Iterable[str]], mtime: float = 0.0) -> "RoamingIndex":
+        plans = tuple(sorted(roaming, key=lambda p: (ROAMING_RANK.get(p, len(ROAMING_RANK)), list(roaming).index(p))))
+        masks: dict = {}
+        for bit, plan in enumerate(plans):
+            for loc in roaming[plan]:
+                loc = loc.lower()
+                masks[loc] = masks.get(loc, 0) | (1 << bit)
+        return cls(plans=plans, masks=MappingProxyType(masks), mtime=mtime)
+
+    def lookup(self, destinations: Iterable[str]) -> Optional[str]:
+        """Return the lowest-ranked plan covering every destination, or None if no plan does."""
+        covering = (1 << len(self.plans)) - 1
+        for loc in destinations:
+            covering &= self.masks.get(loc.lower(), 0)
+            if not covering:
+                return None
+        return self.plans[(covering & -covering).bit_length() - 1]
+
+    def covers(self, plan: str) -> bool:
+        """Whether `plan` is a plan in the catalog."""
+        return plan.lower() in self.plans
+
+
+class RoamingIndexLoader:
+    """
+    Holds the current RoamingIndex for a catalog file and swaps in a rebuilt one when the file changes.
+    The file's mtime is checked at most once every `check_interval` seconds.
+    """
+
+    def __init__(self, path: str = "roaming_locations.json", check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._index: Optional[RoamingIndex] = None
+        self._next_check = 0.0
+
+    def get(self) -> RoamingIndex:
+        now = time.monotonic()
+        if self._index is not None and now < self._next_check:
+            return self._index
+        with self._lock:
+            self._next_check = now + self.check_interval
+            mtime = os.stat(self.path).st_mtime
+            if self._index is None or mtime != self._index.mtime:
+                with open(self.path, 'r') as f:
+                    self._index = RoamingIndex.from_catalog(json.load(f), mtime=mtime)
+            return self._index
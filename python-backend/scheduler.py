@@ -0,0 +1,211 @@
+import asyncio
+import heapq
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from itertools import count
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from telemetry import histogram
+
+# =========================
+# Admission control & scheduling of outbound model/embedding calls
+# =========================
+
+PRIORITY_HIGH = 0 # turns already in the purchase / cancellation flow
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2 # first turn of a new conversation
+PRIORITY_NAMES = {PRIORITY_HIGH: "high", PRIORITY_NORMAL: "normal", PRIORITY_LOW: "low"}
+
+# priority of the calls made by the current turn; set once per request, inherited by sdk tasks
+call_priority: ContextVar[int] = ContextVar("call_priority", default=PRIORITY_NORMAL)
+
+wait_seconds = histogram("telco_scheduler_wait_seconds", "Time outbound calls spent queued for a slot.")
+
+
+class Overloaded(Exception):
+    """
+    The call (or request) was shed instead of queued. `status` is 429 when the tokens-per-minute
+    budget is the bottleneck and 503 when the queue is full; `retry_after` is in seconds.
+    """
+
+    def __init__(self, status: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class CallScheduler:
+    """
+    Global gate for outbound calls: at most `max_concurrency` in flight and, if
+    `tokens_per_minute` > 0, a token bucket refilled at tpm/60 tokens per second.
+    Calls that cannot start wait in a priority queue (FIFO within a priority); when the queue
+    holds `max_queue` calls, or a call has waited `max_wait` seconds, it is rejected instead.
+    New conversations only get `low_priority_share` of the queue, so under overload they are
+    turned away first and conversations already under way keep making progress.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        tokens_per_minute: int = 0,
+        max_queue: int = 200,
+        max_wait: float = 10.0,
+        low_priority_share: float = 0.5,
+    ):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.low_priority_share = low_priority_share
+        self._in_flight = 0
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._queue: List[Tuple[int, int, int, asyncio.Future]] = [] # (priority, seq, tokens, future)
+        self._waiting = 0 # live waiters; _queue also holds entries that timed out or were cancelled until popped
+        self._seq = count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._avg_call_seconds = 1.0
+        self.rejections: Dict[Tuple[str, str], int] = {} # (priority, reason) -> count
+
+    @classmethod
+    def from_env(cls) -> "CallScheduler":
+        return cls(
+            max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", 32)),
+            tokens_per_minute=int(os.environ.get("LLM_TOKENS_PER_MINUTE", 0)),
+            max_queue=int(os.environ.get("LLM_MAX_QUEUE", 200)),
+            max_wait=float(os.environ.get("LLM_MAX_QUEUE_WAIT", 10.0)),
+        )
+
+    # ---- token bucket ----
+
+    def _refill(self) -> None:
+        if self.tokens_per_minute <= 0:
+            return
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.tokens_per_minute), self._tokens + (now - self._refilled_at) * self.tokens_per_minute / 60
+        )
+        self._refilled_at = now
+
+    def _affordable(self, tokens: int) -> bool:
+        # a call bigger than the whole bucket runs once the bucket is full rather than never
+        return self.tokens_per_minute <= 0 or self._tokens >= min(tokens, self.tokens_per_minute)
+
+    def _can_start(self, tokens: int) -> bool:
+        self._refill()
+        return self._in_flight < self.max_concurrency and self._affordable(tokens)
+
+    def _start(self, tokens: int) -> None:
+        self._in_flight += 1
+        if self.tokens_per_minute > 0:
+            self._tokens -= tokens
+
+    # ---- admission ----
+
+    def retry_after(self) -> int:
+        """Rough seconds until the current queue drains."""
+        drain = self._waiting * self._avg_call_seconds / max(1, self.max_concurrency)
+        if self.tokens_per_minute > 0:
+            queued_tokens = sum(t for _, _, t, future in self._queue if not future.done())
+            drain = max(drain, (queued_tokens - self._tokens) * 60 / self.tokens_per_minute)
+        return max(1, math.ceil(drain))
+
+    def _reject(self, priority: int, reason: str) -> Overloaded:
+        key = (PRIORITY_NAMES[priority], reason)
+        self.rejections[key] = self.rejections.get(key, 0) + 1
+        token_bound = self.tokens_per_minute > 0 and self._in_flight < self.max_concurrency
+        return Overloaded(429 if token_bound else 503, self.retry_after(), reason)
+
+    def _queue_limit(self, priority: int) -> int:
+        return int(self.max_queue * self.low_priority_share) if priority == PRIORITY_LOW else self.max_queue
+
+    def admit(self, priority: Optional[int] = None) -> None:
+        """Fast check at the start of a request: raise Overloaded if its calls would be shed anyway."""
+        priority = call_priority.get() if priority is None else priority
+        if self._waiting >= self._queue_limit(priority):
+            raise self._reject(priority, "queue_full")
+
+    # ---- slots ----
+
+    def _dispatch(self) -> None:
+        """Start queued calls, best priority first, while capacity allows."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue:
+            _, _, tokens, future = self._queue[0]
+            if future.done(): # timed out or cancelled while queued
+                heapq.heappop(self._queue)
+                continue
+            if not self._can_start(tokens):
+                break
+            heapq.heappop(self._queue)
+            self._start(tokens)
+            future.set_result(None)
+        if self._queue and self._in_flight < self.max_concurrency and self.tokens_per_minute > 0:
+            # blocked on the token bucket: wake up when the head of the queue becomes affordable
+            needed = min(self._queue[0][2], self.tokens_per_minute) - self._tokens
+            delay = max(0.01, needed * 60 / self.tokens_per_minute)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _release(self, estimated: int, actual: Optional[int]) -> None:
+        """Free a slot; refund (or charge) the difference between estimated and actual tokens."""
+        self._in_flight -= 1
+        if self.tokens_per_minute > 0 and actual is not None:
+            self._tokens = min(float(self.tokens_per_minute), self._tokens + estimated - actual)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tokens: int) -> AsyncIterator[Dict[str, Optional[int]]]:
+        """
+        Hold a call slot for an outbound call expected to use `tokens` tokens.
+        The caller may set usage["tokens"] to the actual count to correct the budget.
+        """
+        priority = call_priority.get()
+        usage: Dict[str, Optional[int]] = {"tokens": None}
+        queued_at = time.monotonic()
+        if not self._waiting and self._can_start(tokens):
+            self._start(tokens)
+        else:
+            if self._waiting >= self._queue_limit(priority):
+                raise self._reject(priority, "queue_full")
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, (priority, next(self._seq), tokens, future))
+            self._waiting += 1
+            self._dispatch()
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+            except BaseException as e:
+                if future.done() and not future.cancelled(): # slot was granted just as we gave up
+                    self._release(tokens, 0)
+                future.cancel()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise self._reject(priority, "queue_timeout") from None
+                raise
+            finally:
+                self._waiting -= 1
+        waited = time.monotonic() - queued_at
+        wait_seconds.observe(waited, priority=PRIORITY_NAMES[priority])
+        started = time.monotonic()
+        try:
+            yield usage
+        finally:
+            self._avg_call_seconds = 0.9 * self._avg_call_seconds + 0.1 * (time.monotonic() - started)
+            self._release(tokens, usage["tokens"])
+
+    def stats(self) -> Dict[str, float]:
+        self._refill()
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for priority, _, _, future in self._queue:
+            if not future.done():
+                depth[PRIORITY_NAMES[priority]] += 1
+        return {
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "tokens_available": self._tokens if self.tokens_per_minute > 0 else -1,
+            **{f"queued_{name}": n for name, n in depth.items()},
+        }
@@ -0,0 +1,125 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# =========================
+# Latency spans & Prometheus-style metrics
+# =========================
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label set."""
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: Dict[LabelKey, List[float]] = {} # bucket counts..., +Inf count, sum
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for key, counts in series.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket{_format_labels(key, ('le', le))} {cumulative:g}"
+            yield f"{self.name}_sum{_format_labels(key)} {counts[-1]:g}"
+            yield f"{self.name}_count{_format_labels(key)} {cumulative:g}"
+
+
+_histograms: Dict[str, Histogram] = {}
+# collectors return (metric name, type, help, [(labels, value), ...]) for gauges/counters owned elsewhere
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, Iterable[Tuple[Dict[str, Any], float]]]]]] = []
+
+def histogram(name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    """Get or create a registered histogram."""
+    if name not in _histograms:
+        _histograms[name] = Histogram(name, help, buckets)
+    return _histograms[name]
+
+def register_collector(fn) -> None:
+    """Register a callable that reports current gauge/counter values at scrape time."""
+    _collectors.append(fn)
+
+def render_prometheus() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for h in _histograms.values():
+        lines.extend(h.render())
+    for collect in _collectors:
+        for name, kind, help, samples in collect():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(_label_key(labels))} {float(value):g}")
+    return "\n".join(lines) + "\n"
+
+
+# =========================
+# Spans
+# =========================
+
+span_seconds = histogram("telco_span_seconds", "Duration of traced phases of a chat turn.")
+
+# spans recorded during the current turn (None outside a turn); tasks spawned by the
+# agents sdk inherit the context, so tool and guardrail spans land in the same list
+_turn_spans: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("turn_spans", default=None)
+
+def start_turn() -> List[Dict[str, Any]]:
+    """Begin collecting spans for the current request; returns the list they are appended to."""
+    spans: List[Dict[str, Any]] = []
+    _turn_spans.set(spans)
+    return spans
+
+@contextmanager
+def span(name: str, **labels: Any) -> Iterator[None]:
+    """Time a phase: observed into telco_span_seconds and added to the current turn's breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        span_seconds.observe(elapsed, span=name, **labels)
+        spans = _turn_spans.get()
+        if spans is not None:
+            spans.append({"span": name, **labels, "ms": round(elapsed * 1000, 3)})
+
+def traced_tool(fn):
+    """Record each call of an async tool function as a "tool" span (apply beneath @function_tool)."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        with span("tool", tool=fn.__name__):
+            return await fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+# =========================
+# Per-conversation serialization & idempotency
+# =========================
+
+class ConversationLocks:
+    """
+    One asyncio.Lock per active conversation, so turns of the same conversation run one
+    after another (each sees the history the previous one saved). Locks are dropped as soon
+    as nobody holds or waits for them, so the table only grows with concurrent conversations.
+    """
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+        self.waits = 0 # turns that had to queue behind another turn of their conversation
+
+    @asynccontextmanager
+    async def hold(self, conversation_id: Optional[str]) -> AsyncIterator[None]:
+        if not conversation_id: # a brand new conversation cannot race with anything
+            yield
+            return
+        lock = self._locks.setdefault(conversation_id, asyncio.Lock())
+        self._users[conversation_id] = self._users.get(conversation_id, 0) + 1
+        try:
+            if lock.locked():
+                self.waits += 1
+            async with lock:
+                yield
+        finally:
+            self._users[conversation_id] -= 1
+            if self._users[conversation_id] == 0:
+                del self._users[conversation_id]
+                del self._locks[conversation_id]
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+
+class IdempotencyCache:
+    """
+    Results of recent requests by idempotency key. The first request with a key runs
+    (begin() returns owner=True) and publishes its result with complete(); retries with the
+    same key join the in-flight run or get the cached result instead of running again.
+    A failed run publishes None, letting the next waiter run it itself.
+    """
+
+    def __init__(self, max_items: int = 10000, ttl_seconds: float = 600):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[asyncio.Future, float]]" = OrderedDict()
+        self.replays = 0 # retries answered from a finished run
+        self.joins = 0 # retries that waited for a run still in flight
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            key, (future, created) = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_items and now - created <= self.ttl_seconds:
+                break
+            if not future.done(): # never drop a run in flight; it gets evicted once it has finished
+                self._entries.move_to_end(key)
+                break
+            del self._entries[key]
+
+    def begin(self, key: str) -> Tuple[asyncio.Future, bool]:
+        """Return (future, owner). Owners must call complete() or fail(); others await the future."""
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and now - entry[1] <= self.ttl_seconds:
+            future = entry[0]
+            if future.done():
+                self.replays += 1
+            else:
+                self.joins += 1
+            return future, False
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = (future, now)
+        self._evict(now)
+        return future, True
+
+    def __contains__(self, key: str) -> bool:
+        """Whether `key` has a run in flight or a cached result, i.e. a retry would not run again."""
+        entry = self._entries.get(key)
+        return entry is not None and time.monotonic() - entry[1] <= self.ttl_seconds
+
+    def complete(self, key: str, result: Any) -> None:
+        entry = self._entries.get(key)
+        if entry is not None and not entry[0].done():
+            entry[0].set_result(result)
+
+    def fail(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None and not entry[0].done():
+            entry[0].set_result(None)
+
+    async def wait(self, future: asyncio.Future) -> Any:
+        """Await another request's run without cancelling it if this request goes away."""
+        return await asyncio.shield(future)
+
+    def __len__(self) -> int:
+        return len(self._entries)
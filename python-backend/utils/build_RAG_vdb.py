@@ -1,51 +1,171 @@
 from openai import OpenAI
+import argparse
+import hashlib
 import os
+import sys
 import json
+import time
+from contextlib import contextmanager
 
 from dotenv import load_dotenv
 load_dotenv()
 assert 'OPENAI_API_KEY' in os.environ, "ERROR: set up your OPENAI_API_KEY"
 
+# Incremental FAQ ingestion: only new/changed questions are re-embedded (in batches),
+# changed entries are upserted and entries no longer in faqs.json are deleted.
+# run from utils/:  python build_RAG_vdb.py [--format milvus|numpy] [--int8] [--full]
+
 ## settings
 EMBED = "text-embedding-3-small"
 EMBEDDIM = 1536 # based on the embedding model. see https://milvus.io/docs/openai.md
+BATCH_SIZE = 256 # inputs per embeddings request
 
-# create embedding function
 openai_client = OpenAI(api_key = os.environ.get("OPENAI_API_KEY"))
-def encode_doc(doc: str) -> list:
-    return openai_client.embeddings.create(model=EMBED,input=doc,encoding_format="float").data[0].embedding
-
-# create vectorDB (use in-memory vdb for now)
-from pymilvus import MilvusClient
-milvus_client = MilvusClient("../milvus.db")
-
-collection_name = "faq"
-# if milvus_client.has_collection(collection_name=collection_name):
-#     milvus_client.drop_collection(collection_name=collection_name)
-
-if not milvus_client.has_collection(collection_name=collection_name)
-    # create collection 
-    milvus_client.create_collection(
-        collection_name=collection_name,
-        dimension=EMBEDDIM,
-        metric_type="COSINE",  # cosine distance
-        consistency_level="Strong",  # See https://milvus.io/docs/consistency.md#Consistency-Level for supported values.
-    )
-    
-    # load faq data
-    with open('./faqs.json','r') as f:
+
+# =========================
+# Stages
+# =========================
+
+timings = {}
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage."""
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16]
+
+def load_faqs(path: str = './faqs.json') -> dict:
+    """FAQ entries keyed by id, with a hash of what is embedded (model + question) and of the full Q/A pair."""
+    with open(path,'r') as f:
         faqs = json.load(f)
-    
-    # embed data (note that this will consume another round of your openAI credits)
-    data = []
-    for k,v in faqs.items():
-        data.append({'id':int(k),
-                 'vector':encode_doc(v['q']),
-                 'question':v['q'],
-                 'answer':v['a']})
-    
-    # insert into database
-    milvus_client.insert(collection_name=collection_name, data=data)
-    print(collection_name, 'collection created')
-else:
-    print(collection_name, 'collection already exists')
+    return {
+        int(k): {
+            'id': int(k),
+            'question': v['q'],
+            'answer': v['a'],
+            'embed_hash': _hash(EMBED, v['q']),
+            'content_hash': _hash(v['q'], v['a']),
+        }
+        for k,v in faqs.items()
+    }
+
+def diff(faqs: dict, existing: dict):
+    """Split entries into (to_embed, to_update, to_delete) against what is already indexed."""
+    to_embed, to_update = [], []
+    for i, entry in faqs.items():
+        old = existing.get(i)
+        if old is None or old.get('embed_hash') != entry['embed_hash'] or old.get('vector') is None:
+            to_embed.append(entry)
+        elif old.get('content_hash') != entry['content_hash']:
+            to_update.append(dict(entry, vector=old['vector'])) # answer changed only: reuse the embedding
+    to_delete = [i for i in existing if i not in faqs]
+    return to_embed, to_update, to_delete
+
+def embed_batches(entries: list) -> list:
+    """Embed entry questions, BATCH_SIZE inputs per request (note that this consumes openAI credits)."""
+    for start in range(0, len(entries), BATCH_SIZE):
+        batch = entries[start:start + BATCH_SIZE]
+        response = openai_client.embeddings.create(model=EMBED, input=[e['question'] for e in batch], encoding_format="float")
+        for entry, item in zip(batch, sorted(response.data, key=lambda d: d.index)):
+            entry['vector'] = item.embedding
+    return entries
+
+# =========================
+# Sinks
+# =========================
+
+class MilvusSink:
+    """milvus lite collection in ../milvus.db"""
+
+    def __init__(self, collection_name: str = "faq", full: bool = False):
+        from pymilvus import MilvusClient
+        self.client = MilvusClient("../milvus.db")
+        self.collection_name = collection_name
+        if full and self.client.has_collection(collection_name=collection_name):
+            self.client.drop_collection(collection_name=collection_name)
+        if not self.client.has_collection(collection_name=collection_name):
+            self.client.create_collection(
+                collection_name=collection_name,
+                dimension=EMBEDDIM,
+                metric_type="COSINE",  # cosine distance
+                consistency_level="Strong",  # See https://milvus.io/docs/consistency.md#Consistency-Level for supported values.
+            )
+            print(collection_name, 'collection created')
+
+    def existing(self) -> dict:
+        rows = self.client.query(
+            collection_name=self.collection_name,
+            filter="id >= 0",
+            output_fields=["id", "vector", "embed_hash", "content_hash"],
+        )
+        return {int(r['id']): r for r in rows}
+
+    def write(self, faqs: dict, upserts: list, deletes: list) -> None:
+        if upserts:
+            self.client.upsert(collection_name=self.collection_name, data=upserts)
+        if deletes:
+            self.client.delete(collection_name=self.collection_name, ids=deletes)
+
+
+class NumpySink:
+    """in-process index at ../faq_index.{npy,json} (see faq_retriever.NumpyFaqRetriever)"""
+
+    def __init__(self, path: str = "../faq_index", quantize: bool = False, full: bool = False):
+        self.path = path
+        self.quantize = quantize
+        self.full = full
+        self._existing = {}
+
+    def existing(self) -> dict:
+        if self.full or not os.path.exists(f"{self.path}.npy"):
+            return {}
+        import numpy as np
+        with open(f"{self.path}.json", "r") as f:
+            meta = json.load(f)
+        vectors = np.load(f"{self.path}.npy").astype(np.float32)
+        if meta.get("dtype") == "int8":
+            vectors *= np.asarray(meta["scales"], dtype=np.float32)[:, None]
+        self._existing = {int(e['id']): dict(e, vector=v.tolist()) for e, v in zip(meta["entries"], vectors)}
+        return self._existing
+
+    def write(self, faqs: dict, upserts: list, deletes: list) -> None:
+        # the matrix is rewritten as a whole (it is tiny); only changed rows were re-embedded
+        from faq_retriever import write_numpy_index
+        vectors = {i: e['vector'] for i, e in self._existing.items()}
+        vectors.update({e['id']: e['vector'] for e in upserts})
+        ids = sorted(faqs)
+        entries = [{k: faqs[i][k] for k in ('id', 'question', 'answer', 'embed_hash', 'content_hash')} for i in ids]
+        write_numpy_index(self.path, entries, [vectors[i] for i in ids], model=EMBED, quantize=self.quantize)
+
+# =========================
+# Pipeline
+# =========================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed utils/faqs.json into a FAQ vector index.")
+    parser.add_argument("--format", choices=["milvus", "numpy"], default="milvus",
+                        help="milvus: milvus lite collection in ../milvus.db; numpy: in-process index at ../faq_index.{npy,json}")
+    parser.add_argument("--int8", action="store_true", help="(numpy only) store int8-quantized vectors")
+    parser.add_argument("--full", action="store_true", help="ignore the existing index and re-embed everything")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(".."))
+    sink = NumpySink(quantize=args.int8, full=args.full) if args.format == "numpy" else MilvusSink(full=args.full)
+
+    with stage("load"):
+        faqs = load_faqs()
+        existing = sink.existing()
+    with stage("diff"):
+        to_embed, to_update, to_delete = diff(faqs, existing)
+    with stage("embed"):
+        embed_batches(to_embed)
+    with stage("write"):
+        sink.write(faqs, to_embed + to_update, to_delete)
+
+    print(f"{len(faqs)} faqs: {len(to_embed)} embedded, {len(to_update)} updated, {len(to_delete)} deleted, "
+          f"{len(faqs) - len(to_embed) - len(to_update)} unchanged")
+    print("timings: " + ", ".join(f"{k} {v * 1000:.0f}ms" for k, v in timings.items()))
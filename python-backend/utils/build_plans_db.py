@@ -2,12 +2,17 @@ import sqlite3
 import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from plans_repository import configure_connection, ensure_schema, schema_version
+
 # generated using gemini
 
 def build_roaming_plans_db(db_name="roaming_plans.db"):
     """
-    Builds an SQLite database and creates a 'plans' table
-    with 'customer_name', 'phone_number', 'roaming_plan', 'timestamp' fields.
+    Builds an SQLite database and creates a 'plans' history table
+    with 'customer_name', 'phone_number', 'roaming_plan', 'timestamp' fields,
+    plus the (phone_number, customer_name, timestamp) lookup index and the trigger-maintained
+    'current_plans' table. Existing db files are migrated to the current schema version. The db is set to WAL mode.
 
     Args:
         db_name (str): The name of the SQLite database file.
@@ -15,7 +20,7 @@ def build_roaming_plans_db(db_name="roaming_plans.db"):
     conn = None # Initialize connection to None
     try:
         # Connect to SQLite database (creates the file if it doesn't exist)
-        conn = sqlite3.connect(db_name)
+        conn = configure_connection(sqlite3.connect(db_name))
         cursor = conn.cursor()
 
         print(f"Connected to database: {db_name}")
@@ -24,22 +29,11 @@ def build_roaming_plans_db(db_name="roaming_plans.db"):
         # DROP TABLE if it exists; trigger manually to be safe
         # cursor.execute('DROP TABLE IF EXISTS plans')
         
-        # SQL statement to create the table if it does not exist
-        # 'IF NOT EXISTS' is crucial for preventing errors if the table already exists
-        create_table_sql = """
-        CREATE TABLE IF NOT EXISTS plans (
-            customer_name TEXT NOT NULL,
-            phone_number TEXT NOT NULL,
-            roaming_plan TEXT DEFAULT 'None', 
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            
-        );
-        """
-
-        cursor.execute(create_table_sql)
-        conn.commit() # Commit the changes to the database
+        # create the tables, index and trigger if they do not exist, or migrate an older db file
+        # (the schema version is kept in PRAGMA user_version)
+        ensure_schema(conn)
 
-        print("Table 'plans' checked/created successfully.")
+        print(f"Tables 'plans' and 'current_plans' checked/created successfully (schema version {schema_version(conn)}).")
 
         # Optional: Verify table creation by listing tables
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='plans';")
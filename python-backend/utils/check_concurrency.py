@@ -0,0 +1,51 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+# Checks that the tools in main.py do not block the event loop: N concurrent FAQ lookups
+# against slow (stubbed) embedding and milvus calls should finish in about the time of one.
+# usage: python utils/check_concurrency.py [N]   (run from python-backend/)
+
+sys.path.insert(0, os.getcwd())
+os.environ.setdefault("EMBED_CACHE_PATH", ":memory:")
+
+import main
+from agents.tool_context import ToolContext
+
+DELAY = 0.5 # seconds per stubbed network/disk call
+
+class _SlowEmbeddings:
+    async def create(self, model, input, encoding_format):
+        await asyncio.sleep(DELAY)
+        return type("R", (), {"data": [type("E", (), {"embedding": [0.0] * 8})()]})()
+
+class _SlowRetriever:
+    blocking = True
+
+    def search(self, vector, limit=1):
+        time.sleep(DELAY) # blocking, like milvus lite
+        return [{"id": 0, "question": "stub question", "answer": "stub answer", "score": 1.0}]
+
+def _invoke(tool, i: int, arguments: str):
+    # the ToolContext the runner would pass (openai-agents 0.24: tool name, call id and raw arguments are required)
+    ctx = ToolContext(context=None, tool_name=tool.name, tool_call_id=f"check-{i}", tool_arguments=arguments)
+    return tool.on_invoke_tool(ctx, arguments)
+
+async def run(n: int) -> float:
+    main.openai_client = type("Client", (), {"embeddings": _SlowEmbeddings()})()
+    main.faq_retriever = _SlowRetriever()
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _invoke(main.roaming_faq_lookup_tool, i, json.dumps({"question": f"question {i}"}))
+        for i in range(n)
+    ])
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else min(8, main.IO_EXECUTOR._max_workers)
+    single = asyncio.run(run(1))
+    parallel = asyncio.run(run(n))
+    print(f"1 lookup: {single:.2f}s, {n} concurrent lookups: {parallel:.2f}s (ratio {parallel / single:.2f})")
+    assert parallel < single * 1.5, "tool I/O is blocking the event loop"
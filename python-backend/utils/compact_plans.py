@@ -0,0 +1,36 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from plans_repository import compact_history, configure_connection, ensure_schema
+
+# Moves old plan history out of the live `plans` table into monthly archive tables
+# (plans_archive_YYYY_MM), keeping `plans` small; current plans live in current_plans and are not touched.
+# Safe to run against a live db: each batch is its own short transaction.
+# usage (from python-backend/): python utils/compact_plans.py roaming_plans.db [--older-than-days 180] [--dry-run]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old roaming plan history into monthly partition tables.")
+    parser.add_argument("db", nargs="?", default="roaming_plans.db")
+    parser.add_argument("--older-than-days", type=int, default=180, help="archive history rows older than this")
+    parser.add_argument("--batch-rows", type=int, default=10000, help="rows moved per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="only report how many rows would move")
+    args = parser.parse_args()
+
+    conn = configure_connection(sqlite3.connect(args.db))
+    ensure_schema(conn) # migrates older db files first
+    # same format as sqlite's CURRENT_TIMESTAMP (utc), so plain string comparison orders correctly
+    before = (datetime.now(timezone.utc) - timedelta(days=args.older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+    start = time.perf_counter()
+    moved = compact_history(conn, before, batch_rows=args.batch_rows, dry_run=args.dry_run)
+    for month, rows in moved.items():
+        print(f"{month}: {rows} rows {'would be ' if args.dry_run else ''}archived")
+    total = sum(moved.values())
+    remaining = conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+    print(f"{total} rows {'to archive' if args.dry_run else 'archived'} (before {before}) in {time.perf_counter() - start:.2f}s; "
+          f"{remaining} rows in plans")
+    conn.close()
@@ -0,0 +1,145 @@
+import argparse
+import os
+import sys
+import time
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from guardrail_classifier import FEATURE_DIM, GuardrailClassifier, hashed_features, read_verdicts
+from guardrail_fastpath import normalize_message
+
+# Trains the local guardrail classifiers from logged LLM verdicts (GUARDRAIL_VERDICT_LOG) and reports
+# how well they agree with the LLM on held-out messages.
+# run from python-backend/:  python utils/train_guardrail_classifier.py verdicts.jsonl [more.jsonl ...] [--out guardrail_models]
+# Messages are split by hash into train (70%), calibration (15%) and test (15%). The confidence
+# thresholds are picked on the calibration split so that decided verdicts agree with the LLM at
+# least --agreement of the time; the test split is only used for the report.
+
+GUARDRAIL_FILES = {"Relevance Guardrail": "relevance", "Jailbreak Guardrail": "jailbreak"}
+
+Example = Tuple[np.ndarray, int, str] # (feature ids, LLM passed, text)
+
+
+def load_examples(paths: List[str]) -> Dict[str, Dict[str, List[Example]]]:
+    """guardrail -> split -> examples. Repeated messages are collapsed to their majority verdict."""
+    votes: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+    texts: Dict[Tuple[str, str], str] = {}
+    for record in read_verdicts(paths):
+        key = (record["guardrail"], normalize_message(record["text"]))
+        votes[key].append(int(record["passed"]))
+        texts.setdefault(key, record["text"])
+    data: Dict[str, Dict[str, List[Example]]] = defaultdict(lambda: {"train": [], "calib": [], "test": []})
+    for (guardrail, norm), labels in votes.items():
+        bucket = zlib.crc32(norm.encode("utf-8")) % 100
+        split = "train" if bucket < 70 else "calib" if bucket < 85 else "test"
+        label = int(sum(labels) * 2 >= len(labels))
+        data[guardrail][split].append((hashed_features(texts[(guardrail, norm)]), label, texts[(guardrail, norm)]))
+    return data
+
+
+def train(examples: List[Example], epochs: int, lr: float, l2: float, seed: int = 0) -> Tuple[np.ndarray, float]:
+    """Logistic regression by SGD, with classes weighted to balance rare failures."""
+    weights = np.zeros(FEATURE_DIM, dtype=np.float32)
+    bias = 0.0
+    positives = sum(y for _, y, _ in examples)
+    negatives = len(examples) - positives
+    class_weight = {1: len(examples) / (2 * max(1, positives)), 0: len(examples) / (2 * max(1, negatives))}
+    rng = np.random.default_rng(seed)
+    for epoch in range(epochs):
+        step = lr / (1 + epoch)
+        for i in rng.permutation(len(examples)):
+            idx, y, _ = examples[i]
+            z = bias + float(weights[idx].sum())
+            p = 1.0 / (1.0 + np.exp(-np.clip(z, -50, 50)))
+            grad = (p - y) * class_weight[y]
+            weights[idx] -= step * (grad + l2 * weights[idx])
+            bias -= step * grad
+    return weights, bias
+
+
+def calibrate(probabilities: np.ndarray, labels: np.ndarray, agreement: float, min_support: int) -> Tuple[float, float]:
+    """
+    Lowest pass threshold (and highest fail threshold) whose decided verdicts agree with the LLM at
+    least `agreement` of the time over at least `min_support` messages; otherwise that side never decides.
+    """
+    pass_at, fail_at = 1.01, -0.01
+    order = np.argsort(-probabilities)
+    agree = np.cumsum(labels[order] == 1) / np.arange(1, len(order) + 1)
+    for n in range(len(order), min_support - 1, -1):
+        if agree[n - 1] >= agreement:
+            pass_at = float(probabilities[order[n - 1]])
+            break
+    order = np.argsort(probabilities)
+    agree = np.cumsum(labels[order] == 0) / np.arange(1, len(order) + 1)
+    for n in range(len(order), min_support - 1, -1):
+        if agree[n - 1] >= agreement:
+            fail_at = float(probabilities[order[n - 1]])
+            break
+    # never let a lopsided log (almost every message passes) turn one side into "decide everything"
+    return max(pass_at, 0.5 + 1e-6), min(fail_at, 0.5 - 1e-6)
+
+
+def evaluate(classifier: GuardrailClassifier, examples: List[Example]) -> Dict[str, float]:
+    decided = agreed = false_passes = false_fails = agreed_at_half = 0
+    start = time.perf_counter()
+    for _, y, text in examples:
+        verdict = classifier.decide(text)
+        agreed_at_half += int((classifier.probability(text) >= 0.5) == bool(y))
+        if verdict is None:
+            continue
+        decided += 1
+        agreed += int(verdict == bool(y))
+        false_passes += int(verdict and not y)
+        false_fails += int(not verdict and y)
+    elapsed = time.perf_counter() - start
+    n = max(1, len(examples))
+    return {
+        "messages": len(examples),
+        "agreement_at_0.5": agreed_at_half / n,
+        "coverage": decided / n,
+        "escalation_rate": 1 - decided / n,
+        "agreement_when_decided": agreed / decided if decided else 0.0,
+        "false_passes": false_passes,
+        "false_fails": false_fails,
+        "us_per_message": elapsed / n / 2 * 1e6, # each message is scored twice above
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train local guardrail classifiers from logged LLM verdicts.")
+    parser.add_argument("logs", nargs="+", help="verdict log files (jsonl)")
+    parser.add_argument("--out", default="guardrail_models", help="directory for <guardrail>.npz")
+    parser.add_argument("--agreement", type=float, default=0.99, help="required agreement with the LLM on decided verdicts")
+    parser.add_argument("--min-support", type=int, default=20, help="fewest calibration messages a threshold may rest on")
+    parser.add_argument("--epochs", type=int, default=8)
+    parser.add_argument("--lr", type=float, default=0.2)
+    parser.add_argument("--l2", type=float, default=1e-4)
+    parser.add_argument("--dry-run", action="store_true", help="report only, do not write the models")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for guardrail, splits in load_examples(args.logs).items():
+        if guardrail not in GUARDRAIL_FILES:
+            print(f"skipping unknown guardrail: {guardrail}")
+            continue
+        print(f"{guardrail}: {len(splits['train'])} train / {len(splits['calib'])} calibration / {len(splits['test'])} test messages")
+        weights, bias = train(splits["train"], args.epochs, args.lr, args.l2)
+        classifier = GuardrailClassifier(weights, bias)
+        calib = splits["calib"]
+        classifier.pass_at, classifier.fail_at = calibrate(
+            np.array([classifier.probability(text) for _, _, text in calib]),
+            np.array([y for _, y, _ in calib]),
+            args.agreement,
+            args.min_support,
+        )
+        print(f"  thresholds: pass at p >= {classifier.pass_at:.3f}, fail at p <= {classifier.fail_at:.3f}")
+        for name, value in evaluate(classifier, splits["test"]).items():
+            print(f"  {name}: {value:.4f}" if isinstance(value, float) else f"  {name}: {value}")
+        if not args.dry_run:
+            path = os.path.join(args.out, f"{GUARDRAIL_FILES[guardrail]}.npz")
+            classifier.save(path)
+            print(f"  saved {path}")
@@ -4,7 +4,7 @@ import { useEffect, useState } from "react";
 import { AgentPanel } from "@/components/agent-panel";
 import { Chat } from "@/components/Chat";
 import type { Agent, AgentEvent, GuardrailCheck, Message } from "@/lib/types";
-import { callChatAPI } from "@/lib/api";
+import { callChatAPI, callChatStreamAPI, fetchAgents } from "@/lib/api";
 
 export default function Home() {
   const [messages, setMessages] = useState<Message[]>([]);
@@ -14,22 +14,28 @@ export default function Home() {
   const [guardrails, setGuardrails] = useState<GuardrailCheck[]>([]);
   const [context, setContext] = useState<Record<string, any>>({});
   const [conversationId, setConversationId] = useState<string | null>(null);
+  // Version of the conversation the client has applied; lets the server send only changes
+  const [cursor, setCursor] = useState<number | null>(null);
   // Loading state while awaiting assistant response
   const [isLoading, setIsLoading] = useState(false);
 
   // Boot the conversation
   useEffect(() => {
+    fetchAgents().then((list) => {
+      if (list) setAgents(list);
+    });
     (async () => {
       const data = await callChatAPI("", conversationId ?? "");
       setConversationId(data.conversation_id);
       setCurrentAgent(data.current_agent);
       setContext(data.context);
+      setCursor(data.cursor ?? null);
       const initialEvents = (data.events || []).map((e: any) => ({
         ...e,
         timestamp: e.timestamp ?? Date.now(),
       }));
       setEvents(initialEvents);
-      setAgents(data.agents || []);
+      if (data.agents) setAgents(data.agents);
       setGuardrails(data.guardrails || []);
       if (Array.isArray(data.messages)) {
         setMessages(
@@ -57,31 +63,94 @@ export default function Home() {
     setMessages((prev) => [...prev, userMsg]);
     setIsLoading(true);
 
-    const data = await callChatAPI(content, conversationId ?? "");
-
-    if (!conversationId) setConversationId(data.conversation_id);
-    setCurrentAgent(data.current_agent);
-    setContext(data.context);
-    if (data.events) {
-      const stamped = data.events.map((e: any) => ({
-        ...e,
-        timestamp: e.timestamp ?? Date.now(),
-      }));
-      setEvents((prev) => [...prev, ...stamped]);
-    }
-    if (data.agents) setAgents(data.agents);
-    // Update guardrails state
-    if (data.guardrails) setGuardrails(data.guardrails);
+    // Stream the turn: render token deltas as a draft message, then replace it
+    // with the final message; other frames are appended to the event log.
+    const draftId = `draft-${Date.now()}`;
+    const data = await callChatStreamAPI(
+      content,
+      conversationId ?? "",
+      ({ event, data }) => {
+        if (event === "conversation") {
+          if (!conversationId) setConversationId(data.conversation_id);
+        } else if (event === "message_delta") {
+          setIsLoading(false);
+          setMessages((prev) => {
+            const draft = prev.find((m) => m.id === draftId);
+            if (draft) {
+              return prev.map((m) =>
+                m.id === draftId
+                  ? { ...m, content: m.content + data.delta, agent: data.agent }
+                  : m
+              );
+            }
+            return [
+              ...prev,
+              {
+                id: draftId,
+                content: data.delta,
+                role: "assistant",
+                agent: data.agent,
+                timestamp: new Date(),
+              },
+            ];
+          });
+        } else if (event === "message") {
+          setMessages((prev) => [
+            ...prev.filter((m) => m.id !== draftId),
+            {
+              id: Date.now().toString() + Math.random().toString(),
+              content: data.content,
+              role: "assistant",
+              agent: data.agent,
+              timestamp: new Date(),
+            },
+          ]);
+          setEvents((prev) => [...prev, { ...data, timestamp: data.timestamp ?? Date.now() }]);
+        } else if (event === "guardrail") {
+          // Guardrail frames arrive as each guardrail decides, usually while the reply is streaming
+          setGuardrails((prev) => [...prev.filter((g) => g.name !== data.name), data]);
+          if (!data.passed) {
+            setMessages((prev) => prev.filter((m) => m.id !== draftId));
+          }
+        } else if (event === "error") {
+          // Conflicts (409) and overload (429/503) end the stream without a done frame
+          setMessages((prev) => [
+            ...prev.filter((m) => m.id !== draftId),
+            {
+              id: Date.now().toString() + Math.random().toString(),
+              content: data.detail ?? "Something went wrong. Please try again.",
+              role: "assistant",
+              agent: currentAgent,
+              timestamp: new Date(),
+            },
+          ]);
+        } else {
+          setEvents((prev) => [...prev, { ...data, timestamp: data.timestamp ?? Date.now() }]);
+        }
+      },
+      cursor
+    );
 
-    if (data.messages) {
-      const responses: Message[] = data.messages.map((m: any) => ({
-        id: Date.now().toString() + Math.random().toString(),
-        content: m.content,
-        role: "assistant",
-        agent: m.agent,
-        timestamp: new Date(),
-      }));
-      setMessages((prev) => [...prev, ...responses]);
+    if (data) {
+      if (!conversationId) setConversationId(data.conversation_id);
+      setCurrentAgent(data.current_agent);
+      // Delta responses only carry the context keys that changed this turn
+      setContext((prev) => (data.delta ? { ...prev, ...data.context } : data.context));
+      setCursor(data.cursor ?? null);
+      if (data.agents) setAgents(data.agents);
+      // Update guardrails state
+      if (data.guardrails) setGuardrails(data.guardrails);
+      // Guardrail refusals are only delivered in the final payload
+      if (data.guardrails && data.guardrails.some((g: any) => !g.passed) && data.messages) {
+        const responses: Message[] = data.messages.map((m: any) => ({
+          id: Date.now().toString() + Math.random().toString(),
+          content: m.content,
+          role: "assistant",
+          agent: m.agent,
+          timestamp: new Date(),
+        }));
+        setMessages((prev) => [...prev.filter((m) => m.id !== draftId), ...responses]);
+      }
     }
 
     setIsLoading(false);
@@ -78,6 +78,11 @@ export function Guardrails({ guardrails, inputGuardrails }: GuardrailsProps) {
                     Failed
                   </Badge>
                 )}
+                {gr.input && gr.decided_by && (
+                  <span className="mt-2 ml-2 self-center text-zinc-400">
+                    via {gr.decided_by}
+                  </span>
+                )}
               </div>
             </CardContent>
           </Card>
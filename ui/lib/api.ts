@@ -1,15 +1,114 @@
-// Helper to call the server
-export async function callChatAPI(message: string, conversationId: string) {
+// One key per user message: the server runs a message once per key, so a retry of
+// the same request returns the original response instead of starting another run.
+export function newIdempotencyKey(): string {
+  return typeof crypto !== "undefined" && "randomUUID" in crypto
+    ? crypto.randomUUID()
+    : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+// Helper to call the server (retried once on network errors, with the same key)
+export async function callChatAPI(
+  message: string,
+  conversationId: string,
+  cursor: number | null = null,
+  idempotencyKey: string = newIdempotencyKey()
+) {
+  for (let attempt = 0; attempt < 2; attempt++) {
+    try {
+      const res = await fetch("/chat", {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          "Idempotency-Key": idempotencyKey,
+        },
+        body: JSON.stringify({ conversation_id: conversationId, message, cursor }),
+      });
+      if (!res.ok) throw new Error(`Chat API error: ${res.status}`);
+      return res.json();
+    } catch (err) {
+      if (!(err instanceof TypeError) || attempt === 1) {
+        console.error("Error sending message:", err);
+        return null;
+      }
+    }
+  }
+  return null;
+}
+
+// The agent graph rarely changes, so it is fetched once (and revalidated by ETag)
+// instead of being repeated in every chat response.
+export async function fetchAgents() {
   try {
-    const res = await fetch("/chat", {
+    const res = await fetch("/agents");
+    if (!res.ok) throw new Error(`Agents API error: ${res.status}`);
+    return res.json();
+  } catch (err) {
+    console.error("Error fetching agents:", err);
+    return null;
+  }
+}
+
+// A single Server-Sent Event frame from /chat/stream
+export interface StreamEvent {
+  event: string;
+  data: any;
+}
+
+// Helper to call the streaming endpoint. Invokes `onEvent` for every SSE frame
+// (message_delta, message, handoff, tool_call, tool_output, context_update,
+// guardrail, error) and resolves with the payload of the final `done` frame.
+export async function callChatStreamAPI(
+  message: string,
+  conversationId: string,
+  onEvent: (ev: StreamEvent) => void,
+  cursor: number | null = null,
+  idempotencyKey: string = newIdempotencyKey()
+) {
+  try {
+    const res = await fetch("/chat/stream", {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ conversation_id: conversationId, message }),
+      headers: {
+        "Content-Type": "application/json",
+        Accept: "text/event-stream",
+        "Idempotency-Key": idempotencyKey,
+      },
+      body: JSON.stringify({ conversation_id: conversationId, message, cursor }),
     });
-    if (!res.ok) throw new Error(`Chat API error: ${res.status}`);
-    return res.json();
+    if (!res.ok || !res.body) throw new Error(`Chat API error: ${res.status}`);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let done: any = null;
+
+    const handleFrame = (frame: string) => {
+      let event = "message";
+      const dataLines: string[] = [];
+      for (const line of frame.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) dataLines.push(line.slice(5).trimStart());
+      }
+      if (dataLines.length === 0) return;
+      const data = JSON.parse(dataLines.join("\n"));
+      if (event === "done") done = data;
+      else onEvent({ event, data });
+    };
+
+    while (true) {
+      const { value, done: finished } = await reader.read();
+      if (finished) break;
+      buffer += decoder.decode(value, { stream: true });
+      let sep = buffer.indexOf("\n\n");
+      while (sep !== -1) {
+        handleFrame(buffer.slice(0, sep));
+        buffer = buffer.slice(sep + 2);
+        sep = buffer.indexOf("\n\n");
+      }
+    }
+    if (buffer.trim()) handleFrame(buffer);
+    return done;
   } catch (err) {
-    console.error("Error sending message:", err);
+    console.error("Error streaming message:", err);
     return null;
   }
 }
@@ -42,5 +42,7 @@ export interface GuardrailCheck {
   reasoning: string
   passed: boolean
   timestamp: Date
+  /** Which stage decided the verdict: "rule", "cache" (verdict cache), "answer_cache", "classifier" or "llm" */
+  decided_by?: string
 }
 
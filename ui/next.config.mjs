@@ -8,6 +8,14 @@ const nextConfig = {
         source: "/chat",
         destination: "http://127.0.0.1:8000/chat",
       },
+      {
+        source: "/chat/stream",
+        destination: "http://127.0.0.1:8000/chat/stream",
+      },
+      {
+        source: "/agents",
+        destination: "http://127.0.0.1:8000/agents",
+      },
     ];
   },
 };